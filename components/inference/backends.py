@@ -0,0 +1,162 @@
+"""Interchangeable inference backends for the sequence classifiers
+
+The civic and bridging models are Hugging Face `AutoModelForSequenceClassification`
+checkpoints, but they do not have to be run as plain fp32 PyTorch. The backend is
+chosen with `INFERENCE_BACKEND`:
+
+    eager  fp32 PyTorch, on the GPU if there is one (the default)
+    int8   PyTorch with the linear layers dynamically quantized to int8 (CPU only)
+    onnx   the model exported to ONNX and run with ONNX Runtime (CPU only). The
+           export is cached next to the checkpoint as `model.onnx`. Requires the
+           `onnxruntime` package, which is not installed by default.
+
+Every backend maps a padded batch of token IDs to a tensor of logits, so callers
+do not depend on the backend. Quantization and ONNX Runtime trade some accuracy
+for speed: measure the difference with `python -m inference.parity` before
+switching a model to another backend.
+"""
+
+import logging
+import os
+
+import safetensors.torch
+import torch
+from transformers import AutoConfig, AutoModelForSequenceClassification
+from transformers.modeling_utils import no_init_weights
+
+from inference.weights import WEIGHTS_FILENAME
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "eager")
+BACKENDS = ("eager", "int8", "onnx")
+
+ONNX_FILENAME = "model.onnx"
+ONNX_OPSET = 14
+
+
+class EagerBackend:
+    """The model as a regular PyTorch module.
+
+    Args:
+        model (torch.nn.Module): The model.
+        device (torch.device): The device to run the model on.
+    """
+
+    def __init__(self, model: torch.nn.Module, device: torch.device):
+        self.model = model.to(device).eval()
+        self.device = device
+
+    def logits(self, inputs) -> torch.Tensor:
+        with torch.no_grad():
+            return self.model(
+                input_ids=inputs["input_ids"].to(self.device),
+                attention_mask=inputs["attention_mask"].to(self.device),
+            ).logits
+
+
+class Int8Backend(EagerBackend):
+    """The model with its linear layers dynamically quantized to int8."""
+
+    def __init__(self, model: torch.nn.Module):
+        quantized = torch.quantization.quantize_dynamic(
+            model.eval(), {torch.nn.Linear}, dtype=torch.qint8
+        )
+        super().__init__(quantized, torch.device("cpu"))
+
+
+class OnnxBackend:
+    """The model exported to ONNX, run with ONNX Runtime.
+
+    Args:
+        model_dir (str): Directory of the Hugging Face checkpoint.
+    """
+
+    def __init__(self, model_dir: str):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError(
+                "The onnx inference backend requires onnxruntime (pip install onnxruntime)"
+            ) from e
+
+        path = os.path.join(model_dir, ONNX_FILENAME)
+        if not os.path.exists(path):
+            export_onnx(model_dir, path)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+
+    def logits(self, inputs) -> torch.Tensor:
+        (logits,) = self.session.run(
+            ["logits"],
+            {
+                "input_ids": inputs["input_ids"].numpy(),
+                "attention_mask": inputs["attention_mask"].numpy(),
+            },
+        )
+        return torch.from_numpy(logits)
+
+
+def load_model(model_dir: str) -> torch.nn.Module:
+    """Load a checkpoint, with its weights memory-mapped from its safetensors file.
+
+    The parameters are backed by the pages of the file instead of being copied into
+    freshly allocated memory, so processes on the same host share them through the
+    page cache.
+    """
+    path = os.path.join(model_dir, WEIGHTS_FILENAME)
+    if not os.path.exists(path):
+        return AutoModelForSequenceClassification.from_pretrained(model_dir).eval()
+    config = AutoConfig.from_pretrained(model_dir)
+    with no_init_weights():
+        model = AutoModelForSequenceClassification.from_config(config)
+    model.load_state_dict(safetensors.torch.load_file(path), assign=True)
+    return model.eval()
+
+
+def export_onnx(model_dir: str, path: str):
+    """Export a checkpoint to ONNX, with dynamic batch size and sequence length."""
+    logger.info(f"Exporting {model_dir} to {path}")
+    model = load_model(model_dir)
+    dummy = torch.ones((1, 8), dtype=torch.long)
+    dynamic_axes = {0: "batch", 1: "sequence"}
+    torch.onnx.export(
+        model,
+        (dummy, dummy),
+        path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": dynamic_axes,
+            "attention_mask": dynamic_axes,
+            "logits": {0: "batch"},
+        },
+        opset_version=ONNX_OPSET,
+    )
+
+
+def load_backend(model_dir: str, backend: str = INFERENCE_BACKEND, device: torch.device = None):
+    """Load a sequence classifier with one of the inference backends.
+
+    Args:
+        model_dir (str): Directory of the Hugging Face checkpoint.
+        backend (str): One of `BACKENDS`.
+        device (torch.device): Device for the eager backend (default: the GPU if there
+                               is one). The other backends always run on the CPU.
+
+    Returns:
+        The backend, whose `logits(inputs)` runs the model on a padded batch.
+    """
+    logger.info(f"Loading {model_dir} with the {backend} inference backend")
+    if backend == "eager":
+        if device is None:
+            device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+        return EagerBackend(load_model(model_dir), device)
+    if backend == "int8":
+        return Int8Backend(load_model(model_dir))
+    if backend == "onnx":
+        return OnnxBackend(model_dir)
+    raise ValueError(f"Unknown inference backend {backend!r}, expected one of {BACKENDS}")
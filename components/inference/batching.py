@@ -0,0 +1,91 @@
+"""Length-bucketed batching of classifier inputs
+
+Tokenizing a batch with `padding=True` pads every text to the longest one in the
+batch, so a single long post makes the model process mostly padding for all the
+short ones. Instead, texts are tokenized without padding (truncated to
+`INFERENCE_MAX_LENGTH` tokens), sorted by length and split into sub-batches of
+similar length, capped both in number of texts and in padded tokens. Each
+sub-batch is padded only to its own longest text, and the outputs are put back in
+the original order of the texts.
+
+This module only depends on the tokenizer interface, not on any model, so the same
+bucketing serves every classifier.
+"""
+
+import os
+from typing import Any, Callable
+
+INFERENCE_MAX_LENGTH = int(os.getenv("INFERENCE_MAX_LENGTH", 128))
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", 64))
+INFERENCE_MAX_BATCH_TOKENS = int(os.getenv("INFERENCE_MAX_BATCH_TOKENS", 4096))
+
+
+def length_buckets(
+    lengths: list[int],
+    max_batch_size: int = INFERENCE_MAX_BATCH_SIZE,
+    max_batch_tokens: int = INFERENCE_MAX_BATCH_TOKENS,
+) -> list[list[int]]:
+    """Group inputs into sub-batches of similar length.
+
+    Args:
+        lengths (list[int]): Length (in tokens) of each input.
+        max_batch_size (int): Maximum number of inputs in a sub-batch.
+        max_batch_tokens (int): Maximum number of tokens in a sub-batch once padded
+                                (a single longer input still gets its own sub-batch).
+
+    Returns:
+        list[list[int]]: Indices of the inputs in each sub-batch, from shortest to
+                         longest.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    buckets = []
+    bucket = []
+    for i in order:
+        # Inputs are sorted, so the padded length of the bucket is that of this input.
+        if bucket and (
+            len(bucket) >= max_batch_size or (len(bucket) + 1) * lengths[i] > max_batch_tokens
+        ):
+            buckets.append(bucket)
+            bucket = []
+        bucket.append(i)
+    if bucket:
+        buckets.append(bucket)
+    return buckets
+
+
+def run_bucketed(
+    tokenizer,
+    texts: list[str],
+    forward: Callable[[Any], list],
+    max_length: int = INFERENCE_MAX_LENGTH,
+    max_batch_size: int = INFERENCE_MAX_BATCH_SIZE,
+    max_batch_tokens: int = INFERENCE_MAX_BATCH_TOKENS,
+) -> list:
+    """Run a model over texts in length-bucketed sub-batches.
+
+    Args:
+        tokenizer: Hugging Face tokenizer of the model.
+        texts (list[str]): The texts to run the model on.
+        forward (Callable[[Any], list]): Runs the model on one padded sub-batch (a
+                                         `BatchEncoding` of PyTorch tensors) and
+                                         returns one output per text in it.
+        max_length (int): Texts are truncated to this many tokens.
+        max_batch_size (int): Maximum number of texts per forward pass.
+        max_batch_tokens (int): Maximum number of padded tokens per forward pass.
+
+    Returns:
+        list: The output for each text, in the order of `texts`.
+    """
+    if len(texts) == 0:
+        return []
+    encodings = tokenizer(texts, truncation=True, max_length=max_length)
+    input_ids = encodings["input_ids"]
+    outputs = [None] * len(texts)
+    for bucket in length_buckets([len(ids) for ids in input_ids], max_batch_size, max_batch_tokens):
+        batch = tokenizer.pad(
+            {key: [encodings[key][i] for i in bucket] for key in encodings.keys()},
+            return_tensors="pt",
+        )
+        for i, output in zip(bucket, forward(batch)):
+            outputs[i] = output
+    return outputs
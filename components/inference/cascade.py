@@ -0,0 +1,156 @@
+"""Cheap-first cascade for civic classification
+
+Most posts are obviously civic or obviously not, and do not need a transformer to
+tell. In cascade mode, every text is first scored by a hashed n-gram logistic
+regression distilled from the civic model (see `inference.fit_cascade`). Texts it
+scores at or above `CIVIC_CASCADE_HIGH` are labelled civic, and at or below
+`CIVIC_CASCADE_LOW` not civic; only the texts in between are escalated to the
+full model.
+
+To keep an eye on the quality of the first stage, a random `CIVIC_CASCADE_AUDIT_RATE`
+of the texts it labels is also sent to the full model (in the same forward pass as
+the escalated texts). The escalation rate and the agreement of the first stage
+with the full model on the audited texts are logged periodically.
+
+Cascade mode is enabled by pointing `CIVIC_CASCADE_MODEL` at a fitted first stage.
+"""
+
+import logging
+import os
+import random
+import re
+import zlib
+
+import numpy as np
+
+from inference.models import Classifier, Predictions
+
+logger = logging.getLogger(__name__)
+
+CIVIC_CASCADE_MODEL = os.getenv("CIVIC_CASCADE_MODEL")
+CIVIC_CASCADE_LOW = float(os.getenv("CIVIC_CASCADE_LOW", 0.05))
+CIVIC_CASCADE_HIGH = float(os.getenv("CIVIC_CASCADE_HIGH", 0.95))
+CIVIC_CASCADE_AUDIT_RATE = float(os.getenv("CIVIC_CASCADE_AUDIT_RATE", 0.02))
+
+# Log cumulative escalation and agreement rates every time this many more texts
+# have been labelled.
+CIVIC_CASCADE_REPORT_EVERY = int(os.getenv("CIVIC_CASCADE_REPORT_EVERY", 1000))
+
+TOKEN_PATTERN = re.compile(r"[#@]?\w+")
+
+
+class HashedNgramModel:
+    """Logistic regression over hashed word unigrams and bigrams.
+
+    Args:
+        weights (np.ndarray): One weight per hash bucket.
+        bias (float): Intercept.
+    """
+
+    def __init__(self, weights: np.ndarray, bias: float = 0.0):
+        self.weights = weights
+        self.bias = bias
+
+    @property
+    def n_features(self) -> int:
+        return len(self.weights)
+
+    def features(self, text: str) -> np.ndarray:
+        """Hash buckets of the unigrams and bigrams in a text (each counted once)."""
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        ngrams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        return np.unique(
+            np.array([zlib.crc32(ngram.encode("utf-8")) for ngram in ngrams], dtype=np.int64)
+            % self.n_features
+        )
+
+    def predict_proba(self, texts: list[str]) -> np.ndarray:
+        """Probability that each text is civic."""
+        scores = np.array([self.weights[self.features(text)].sum() for text in texts])
+        return 1 / (1 + np.exp(-(scores + self.bias)))
+
+    def save(self, path: str):
+        np.savez_compressed(path, weights=self.weights, bias=self.bias)
+
+    @classmethod
+    def load(cls, path: str) -> "HashedNgramModel":
+        with np.load(path) as data:
+            return cls(data["weights"], float(data["bias"]))
+
+
+class Cascade:
+    """A binary classifier that only runs the full model on texts the first stage is unsure of.
+
+    Args:
+        first_stage (HashedNgramModel): Cheap model, scoring the probability of label 1.
+        full_model (Classifier): The model the first stage was distilled from.
+        low (float): First-stage probabilities at or below this are labelled 0.
+        high (float): First-stage probabilities at or above this are labelled 1.
+        audit_rate (float): Fraction of first-stage labels that are checked against
+                            the full model.
+    """
+
+    def __init__(
+        self,
+        first_stage: HashedNgramModel,
+        full_model: Classifier,
+        low: float = CIVIC_CASCADE_LOW,
+        high: float = CIVIC_CASCADE_HIGH,
+        audit_rate: float = CIVIC_CASCADE_AUDIT_RATE,
+    ):
+        self.first_stage = first_stage
+        self.full_model = full_model
+        self.low = low
+        self.high = high
+        self.audit_rate = audit_rate
+        self.labelled = 0
+        self.escalated = 0
+        self.audited = 0
+        self.agreed = 0
+        self._next_report = CIVIC_CASCADE_REPORT_EVERY
+
+    def predict(self, texts: list[str]) -> Predictions:
+        """Class probabilities and labels, like `Classifier.predict`."""
+        civic = self.first_stage.predict_proba(texts)
+        probabilities = [[1 - p, p] for p in civic.tolist()]
+        labels = [int(p >= 0.5) for p in civic]
+        escalate = [i for i, p in enumerate(civic) if self.low < p < self.high]
+        audit = [
+            i for i, p in enumerate(civic)
+            if not self.low < p < self.high and random.random() < self.audit_rate
+        ]
+
+        if len(escalate) + len(audit) > 0:
+            full = self.full_model.predict([texts[i] for i in escalate + audit])
+            for i, p, label in zip(escalate, full.probabilities, full.labels):
+                probabilities[i] = p
+                labels[i] = label
+            for i, label in zip(audit, full.labels[len(escalate):]):
+                self.agreed += labels[i] == label
+
+        self.labelled += len(texts)
+        self.escalated += len(escalate)
+        self.audited += len(audit)
+        if self.labelled >= self._next_report:
+            self._next_report = self.labelled + CIVIC_CASCADE_REPORT_EVERY
+            logger.info(f"Cascade rates: {self.rates()}")
+        return Predictions(probabilities, labels)
+
+    def rates(self) -> dict[str, float]:
+        """Fraction of texts escalated, and first-stage agreement with the full model."""
+        return {
+            "escalation": self.escalated / max(self.labelled, 1),
+            "agreement": self.agreed / max(self.audited, 1),
+            "audited": self.audited,
+        }
+
+
+def civic_cascade(full_model: Classifier) -> Cascade | Classifier:
+    """The civic cascade if `CIVIC_CASCADE_MODEL` is set, else just the full model."""
+    if not CIVIC_CASCADE_MODEL:
+        return full_model
+    logger.info(
+        f"Civic cascade enabled with {CIVIC_CASCADE_MODEL} "
+        f"(low={CIVIC_CASCADE_LOW}, high={CIVIC_CASCADE_HIGH})"
+    )
+    return Cascade(HashedNgramModel.load(CIVIC_CASCADE_MODEL), full_model)
@@ -0,0 +1,89 @@
+"""Distil the civic model into the first stage of the cascade
+
+Labels a sample of posts with the full civic model, fits a hashed n-gram logistic
+regression to its probabilities, and reports, on a held-out part of the sample,
+how many texts the cascade would escalate and how often its own labels agree with
+the full model for a few threshold pairs. Run from the `components` directory, e.g.
+
+    python -m inference.fit_cascade scorer_worker/model_civic posts.jsonl civic_cascade.npz
+
+then set `CIVIC_CASCADE_MODEL` to the output file, and `CIVIC_CASCADE_LOW` and
+`CIVIC_CASCADE_HIGH` to the chosen thresholds. The sample is a JSONL file of objects
+with a `text` field, or a plain text file with one post per line.
+"""
+
+import argparse
+import json
+import random
+
+import numpy as np
+
+from inference.cascade import HashedNgramModel
+from inference.models import Classifier
+from inference.parity import load_sample
+
+THRESHOLDS = [(0.02, 0.98), (0.05, 0.95), (0.1, 0.9), (0.2, 0.8)]
+
+
+def fit(
+    texts: list[str],
+    targets: np.ndarray,
+    n_features: int,
+    epochs: int,
+    learning_rate: float = 0.5,
+    l2: float = 1e-6,
+) -> HashedNgramModel:
+    """Fit the model to soft targets by full-batch gradient descent on the log loss."""
+    model = HashedNgramModel(np.zeros(n_features))
+    features = [model.features(text) for text in texts]
+    rows = np.repeat(np.arange(len(texts)), [len(f) for f in features])
+    columns = np.concatenate(features)
+    for _ in range(epochs):
+        scores = np.bincount(rows, weights=model.weights[columns], minlength=len(texts))
+        errors = 1 / (1 + np.exp(-(scores + model.bias))) - targets
+        gradient = np.bincount(columns, weights=errors[rows], minlength=n_features)
+        model.weights -= learning_rate * (gradient / len(texts) + l2 * model.weights)
+        model.bias -= learning_rate * errors.mean()
+    return model
+
+
+def evaluate(civic: np.ndarray, full_labels: np.ndarray, low: float, high: float) -> dict:
+    confident = (civic <= low) | (civic >= high)
+    agreement = ((civic >= 0.5) == full_labels)[confident].mean() if confident.any() else 1.0
+    return {"escalation": float(1 - confident.mean()), "agreement": float(agreement)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("model_dir", help="directory of the civic model checkpoint")
+    parser.add_argument("sample", help="posts to distil on (.jsonl with a text field, or .txt)")
+    parser.add_argument("output", help="where to save the first stage (.npz)")
+    parser.add_argument("--n-features", type=int, default=2**18, help="number of hash buckets")
+    parser.add_argument("--epochs", type=int, default=200, help="gradient descent epochs")
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction held out")
+    args = parser.parse_args()
+
+    texts = load_sample(args.sample)
+    random.Random(0).shuffle(texts)
+    full_model = Classifier("civic", "", args.model_dir)
+    civic = np.array([p[1] for p in full_model.predict(texts).probabilities])
+
+    n_train = int(len(texts) * (1 - args.holdout))
+    model = fit(texts[:n_train], civic[:n_train], args.n_features, args.epochs)
+    model.save(args.output)
+
+    first_stage = model.predict_proba(texts[n_train:])
+    full_labels = civic[n_train:] >= 0.5
+    report = {
+        "train": n_train,
+        "holdout": len(texts) - n_train,
+        **{
+            f"low={low},high={high}": evaluate(first_stage, full_labels, low, high)
+            for low, high in THRESHOLDS
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Registry of the classifiers, loaded lazily, once per process
+
+Every consumer of a model (the scorer and sandbox workers) registers it here under
+a name and version, and runs it through `Classifier.predict` (or
+`Classifier.score` for single-output regressors such as the bridging model).
+Registering the same name and version twice returns the same classifier, so each
+model is loaded at most once per process, and batching, caching or a faster
+inference backend apply to every consumer at once.
+
+Importing this module loads nothing (and imports neither PyTorch nor
+Transformers): a model is loaded on first use, or when the worker loads all the
+registered models at start-up (see `load_all` and `warm_up`). Loading downloads
+and verifies the weights if needed (see `inference.weights`) and logs how long it
+took.
+"""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from inference.batching import run_bucketed
+from inference.weights import ensure_weights
+
+logger = logging.getLogger(__name__)
+
+WARM_UP_TEXT = "The city council votes on the new budget tomorrow."
+
+# Versions of the models every consumer registers. Bump these whenever a model
+# changes, so stale labels and scores are never served from the label cache.
+CIVIC_MODEL_VERSION = os.getenv("CIVIC_MODEL_VERSION", "civic-v1")
+BRIDGING_MODEL_VERSION = os.getenv("BRIDGING_MODEL_VERSION", "bridging-v1")
+
+
+@dataclass
+class Predictions:
+    probabilities: list[list[float]]
+    labels: list[int]
+
+
+class Classifier:
+    """A sequence classifier's tokenizer and inference backend, loaded on first use.
+
+    Args:
+        name (str): Name of the model.
+        version (str): Version of the model.
+        model_dir (str): Directory of the Hugging Face checkpoint.
+        url (str | None): Where to download the weights from if they are missing.
+        sha256 (str | None): Expected SHA-256 checksum of the weights, if known.
+        backend (str | None): Inference backend (default: `INFERENCE_BACKEND`).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        version: str,
+        model_dir: str,
+        url: str | None = None,
+        sha256: str | None = None,
+        backend: str | None = None,
+    ):
+        self.name = name
+        self.version = version
+        self.model_dir = model_dir
+        self.url = url
+        self.sha256 = sha256
+        self.backend_name = backend
+        self._lock = threading.Lock()
+        self._tokenizer = None
+        self._backend = None
+
+    def load(self):
+        """Load the model, if it is not loaded yet."""
+        if self._backend is not None:
+            return
+        with self._lock:
+            if self._backend is not None:
+                return
+            from transformers import AutoTokenizer
+
+            from inference.backends import INFERENCE_BACKEND, load_backend
+
+            start = time.perf_counter()
+            ensure_weights(self.model_dir, self.url, self.sha256)
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+            self._backend = load_backend(self.model_dir, self.backend_name or INFERENCE_BACKEND)
+            logger.info(
+                f"Loaded the {self.name} model ({self.version}) in "
+                f"{time.perf_counter() - start:.2f}s"
+            )
+
+    def logits(self, texts: list[str]):
+        """The logits of each text, as a tensor of shape (len(texts), number of outputs).
+
+        `texts` must not be empty.
+        """
+        import torch
+
+        self.load()
+        rows = run_bucketed(
+            self._tokenizer, texts, lambda inputs: list(self._backend.logits(inputs))
+        )
+        return torch.stack(rows)
+
+    def predict(self, texts: list[str]) -> Predictions:
+        """Class probabilities and most likely class of each text."""
+        if len(texts) == 0:
+            return Predictions([], [])
+        probabilities = self.logits(texts).softmax(dim=-1)
+        return Predictions(probabilities.tolist(), probabilities.argmax(dim=-1).tolist())
+
+    def score(self, texts: list[str]) -> list[float]:
+        """The output of a single-output (regression) model for each text."""
+        if len(texts) == 0:
+            return []
+        return self.logits(texts).reshape(-1).tolist()
+
+
+_registry: dict[tuple[str, str], Classifier] = {}
+_registry_lock = threading.Lock()
+
+
+def register(name: str, version: str, model_dir: str, **kwargs) -> Classifier:
+    """Register a classifier, or return the one already registered as `name` and `version`.
+
+    Takes the same arguments as `Classifier`.
+    """
+    with _registry_lock:
+        if (name, version) not in _registry:
+            _registry[name, version] = Classifier(name, version, model_dir, **kwargs)
+        return _registry[name, version]
+
+
+def get(name: str, version: str | None = None) -> Classifier:
+    """A registered classifier, by default the most recently registered version.
+
+    Raises:
+        KeyError: If no such classifier is registered.
+    """
+    if version is not None:
+        return _registry[name, version]
+    versions = [classifier for (n, _), classifier in _registry.items() if n == name]
+    if len(versions) == 0:
+        raise KeyError(name)
+    return versions[-1]
+
+
+def load_all():
+    """Load every registered classifier."""
+    for classifier in list(_registry.values()):
+        classifier.load()
+
+
+def warm_up():
+    """Load every registered classifier and run it once, so the first real call is fast."""
+    start = time.perf_counter()
+    for classifier in list(_registry.values()):
+        classifier.logits([WARM_UP_TEXT])
+    logger.info(f"Models ready after {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,76 @@
+"""Accuracy-parity check of the inference backends against fp32 PyTorch
+
+Runs a checkpoint over a held-out sample of posts with the eager fp32 backend and
+with each backend under test, and reports how far the outputs drift and how much
+faster each backend is. Run from the `components` directory, e.g.
+
+    python -m inference.parity scorer_worker/model_civic held_out.jsonl int8 onnx
+
+The sample is a JSONL file of objects with a `text` field, or a plain text file
+with one post per line. For classifiers (more than one logit), the report gives
+the fraction of labels that agree with fp32; for regressors (one logit, such as
+the bridging model), the mean and maximum absolute difference of the scores.
+"""
+
+import argparse
+import json
+import time
+
+import torch
+from transformers import AutoTokenizer
+
+from inference.backends import BACKENDS, load_backend
+from inference.batching import run_bucketed
+
+
+def load_sample(path: str) -> list[str]:
+    with open(path) as file:
+        lines = [line for line in file if line.strip()]
+    if path.endswith(".jsonl"):
+        return [json.loads(line)["text"] for line in lines]
+    return [line.rstrip("\n") for line in lines]
+
+
+def run_backend(backend, tokenizer, texts: list[str]) -> tuple[torch.Tensor, float]:
+    """The logits of every text, and the time it took to compute them."""
+    start = time.perf_counter()
+    logits = run_bucketed(tokenizer, texts, lambda inputs: list(backend.logits(inputs)))
+    return torch.stack(logits), time.perf_counter() - start
+
+
+def compare(reference: torch.Tensor, logits: torch.Tensor) -> dict:
+    if reference.shape[-1] > 1:
+        agreement = (reference.argmax(dim=-1) == logits.argmax(dim=-1)).float().mean()
+        return {"label_agreement": agreement.item()}
+    difference = (reference - logits).abs()
+    return {"mean_abs_diff": difference.mean().item(), "max_abs_diff": difference.max().item()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("model_dir", help="directory of the Hugging Face checkpoint")
+    parser.add_argument("sample", help="held-out posts (.jsonl with a text field, or .txt)")
+    parser.add_argument("backends", nargs="+", choices=BACKENDS, help="backends to check")
+    parser.add_argument("--limit", type=int, help="only use the first LIMIT posts")
+    args = parser.parse_args()
+
+    texts = load_sample(args.sample)[: args.limit]
+    tokenizer = AutoTokenizer.from_pretrained(args.model_dir)
+
+    # fp32 reference, on the CPU so that the timings are comparable.
+    eager = load_backend(args.model_dir, "eager", device=torch.device("cpu"))
+    reference, reference_seconds = run_backend(eager, tokenizer, texts)
+
+    report = {"texts": len(texts), "eager_ms_per_text": reference_seconds * 1000 / len(texts)}
+    for name in args.backends:
+        logits, seconds = run_backend(load_backend(args.model_dir, name), tokenizer, texts)
+        report[name] = {
+            **compare(reference, logits),
+            "ms_per_text": seconds * 1000 / len(texts),
+            "speedup": reference_seconds / seconds,
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Local cache of model weights
+
+Model checkpoints are kept in the repository without their weights, which are
+published as safetensors files (e.g. at `CIVIC_MODEL_S3_URL`). `ensure_weights`
+downloads a checkpoint's weights into `MODEL_CACHE_DIR` the first time they are
+needed, links them into the checkpoint directory, and verifies their SHA-256
+checksum: the one given (e.g. `CIVIC_MODEL_SHA256`), else the one checked in next to
+the checkpoint's `config.json` as `model.safetensors.sha256`. The checksum of a
+file is only computed again if the file changes, so verified weights cost nothing
+to check on later starts.
+
+The images fetch the weights at build time with
+
+    python -m inference.weights scorer_worker/model_civic "$CIVIC_MODEL_S3_URL" \
+        --sha256 "$CIVIC_MODEL_SHA256"
+
+which, unlike loading a model, refuses weights without a known checksum.
+
+Safetensors files are memory-mapped when loaded, so processes on the same host
+share the pages of the cached file rather than each reading it into memory.
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import tempfile
+import urllib.request
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", os.path.expanduser("~/.cache/feed-span/models"))
+WEIGHTS_FILENAME = "model.safetensors"
+CHECKSUM_FILENAME = f"{WEIGHTS_FILENAME}.sha256"
+
+
+class ChecksumError(Exception):
+    """Model weights do not match their expected checksum."""
+
+
+def sha256sum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def verify(path: str, sha256: str):
+    """Check the checksum of a file, unless it was already verified and is unchanged.
+
+    Raises:
+        ChecksumError: If the checksum does not match.
+    """
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    fingerprint = f"{sha256} {stat.st_size} {stat.st_mtime_ns}"
+    marker = f"{path}.verified"
+    if os.path.exists(marker):
+        with open(marker) as file:
+            if file.read() == fingerprint:
+                return
+
+    actual = sha256sum(path)
+    if actual != sha256.lower():
+        raise ChecksumError(f"{path} has SHA-256 {actual}, expected {sha256}")
+    with open(marker, "w") as file:
+        file.write(fingerprint)
+
+
+def download(url: str, path: str, sha256: str | None = None):
+    """Download a file atomically, so a partial download is never mistaken for weights."""
+    logger.info(f"Downloading {url} to {path}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    os.close(fd)
+    try:
+        urllib.request.urlretrieve(url, tmp_path)
+        if sha256 is not None:
+            actual = sha256sum(tmp_path)
+            if actual != sha256.lower():
+                raise ChecksumError(f"{url} has SHA-256 {actual}, expected {sha256}")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def expected_sha256(model_dir: str) -> str | None:
+    """The checksum of a checkpoint's weights checked in next to it, if any."""
+    path = os.path.join(model_dir, CHECKSUM_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return file.read().split()[0]
+
+
+def ensure_weights(model_dir: str, url: str | None = None, sha256: str | None = None) -> str:
+    """Make sure a checkpoint's weights are present, downloading them if needed.
+
+    Args:
+        model_dir (str): Directory of the Hugging Face checkpoint.
+        url (str | None): Where to download the weights from if they are missing.
+        sha256 (str | None): Expected SHA-256 checksum of the weights (default: the
+                             one checked in with the checkpoint, if any).
+
+    Returns:
+        str: Path of the weights in the checkpoint directory.
+
+    Raises:
+        FileNotFoundError: If the weights are missing and there is no URL.
+        ChecksumError: If the weights do not match the checksum.
+    """
+    path = os.path.join(model_dir, WEIGHTS_FILENAME)
+    sha256 = sha256 or expected_sha256(model_dir)
+    if not os.path.exists(path):
+        if url is None:
+            raise FileNotFoundError(f"No weights at {path}, and no URL to download them from")
+        url_hash = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+        cached = os.path.join(MODEL_CACHE_DIR, f"{url_hash}-{os.path.basename(urlparse(url).path)}")
+        if not os.path.exists(cached):
+            download(url, cached, sha256)
+        if os.path.islink(path):
+            os.remove(path)  # dangling link into a cache that was cleared
+        try:
+            os.symlink(cached, path)
+        except FileExistsError:
+            pass  # linked by another process in the meantime
+    if sha256 is not None:
+        verify(path, sha256)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download and verify a checkpoint's weights")
+    parser.add_argument("model_dir", help="directory of the Hugging Face checkpoint")
+    parser.add_argument("url", help="where to download the weights from if they are missing")
+    parser.add_argument("--sha256", help=f"expected checksum (default: {CHECKSUM_FILENAME})")
+    args = parser.parse_args()
+
+    sha256 = args.sha256 or expected_sha256(args.model_dir)
+    if not sha256:
+        parser.error(f"no checksum given, and no {CHECKSUM_FILENAME} in {args.model_dir}")
+    logging.basicConfig(level=logging.INFO)
+    ensure_weights(args.model_dir, args.url, sha256)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Micro-benchmark of the replacement engine
+
+Times `replace_civic_items` against the list-based loop it replaced, across feed
+sizes and candidate pool sizes. Run from the `components` directory with
+
+    python -m ranking_server.bench_replacement
+
+The legacy loop is quadratic in the feed size and linear in the pool size per
+replacement, so it is skipped for the largest combinations unless `--legacy-all`
+is given.
+"""
+
+import argparse
+import random
+import timeit
+
+from ranking_server.replacement import DOSE, replace_civic_items
+
+FEED_SIZES = [20, 200, 2000]
+POOL_SIZES = [5_000, 100_000, 1_000_000]
+
+# Proportions of the feed that are civic, and of the pool already recommended.
+CIVIC_RATE = 0.3
+RECOMMENDED_RATE = 0.01
+
+# Legacy runs above this many feed items x pool candidates are skipped by default.
+LEGACY_LIMIT = 200 * 100_000
+
+
+def make_inputs(feed_size: int, pool_size: int, seed: int = 0):
+    rng = random.Random(seed)
+    item_ids = [f"item{i}" for i in range(feed_size)]
+    civic_status = [rng.random() < CIVIC_RATE for _ in range(feed_size)]
+    candidates = [
+        {"id": f"post{i}", "url": f"https://example.com/{i}", "bridging_score": 1 - i / pool_size}
+        for i in range(pool_size)
+    ]
+    already_recommended = {
+        f"post{i}" for i in rng.sample(range(pool_size), int(RECOMMENDED_RATE * pool_size))
+    }
+    return item_ids, civic_status, candidates, already_recommended
+
+
+def legacy_replace(item_ids, civic_status, candidates, already_recommended, dose=DOSE):
+    """The replacement loop as it was written inline in `rank()`."""
+    replacement_candidates = [x for x in candidates if x["id"] not in already_recommended]
+    civic_post_ids = [id for id, is_civic in zip(item_ids, civic_status) if is_civic]
+    counter = 0
+    ranked_ids = []
+    for id in item_ids:
+        if id in civic_post_ids and len(replacement_candidates) > 0:
+            candidate = replacement_candidates.pop(0)
+            if candidate["id"] not in item_ids:
+                ranked_ids.append(candidate["id"])
+                counter += 1
+            else:
+                ranked_ids.append(id)
+        else:
+            ranked_ids.append(id)
+    for _ in range(int(dose * len(item_ids)) - counter):
+        if len(replacement_candidates) > 0:
+            candidate = replacement_candidates.pop(0)
+            if candidate["id"] not in ranked_ids:
+                ranked_ids.append(candidate["id"])
+    return ranked_ids
+
+
+def best_of(fn, repeat: int) -> float:
+    """Fastest of `repeat` runs, in milliseconds."""
+    return min(timeit.repeat(fn, number=1, repeat=repeat)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement")
+    parser.add_argument("--legacy-all", action="store_true", help="time every legacy run")
+    args = parser.parse_args()
+
+    print(f"{'feed':>6} {'pool':>10} {'engine ms':>10} {'legacy ms':>10} {'speedup':>8}")
+    for pool_size in POOL_SIZES:
+        pool_inputs = make_inputs(max(FEED_SIZES), pool_size)
+        for feed_size in FEED_SIZES:
+            item_ids, civic_status, candidates, already_recommended = pool_inputs
+            item_ids, civic_status = item_ids[:feed_size], civic_status[:feed_size]
+
+            engine_ms = best_of(
+                lambda: replace_civic_items(
+                    item_ids, civic_status, candidates, already_recommended
+                ),
+                args.repeat,
+            )
+            if args.legacy_all or feed_size * pool_size <= LEGACY_LIMIT:
+                legacy_ms = best_of(
+                    lambda: legacy_replace(item_ids, civic_status, candidates, already_recommended),
+                    args.repeat,
+                )
+                legacy = f"{legacy_ms:>10.3f} {legacy_ms / engine_ms:>7.1f}x"
+            else:
+                legacy = f"{'skipped':>10} {'':>8}"
+            print(f"{feed_size:>6} {pool_size:>10} {engine_ms:>10.3f} {legacy}")
+
+
+if __name__ == "__main__":
+    main()
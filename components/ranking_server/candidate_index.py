@@ -0,0 +1,94 @@
+"""In-process index of candidate bridging posts
+
+The sandbox worker keeps the candidate posts for each platform in a Redis hash of
+post ID to post JSON (see `sandbox_worker.tasks.refresh_posts_in_redis`) and bumps
+`posts_version` every time they change. The ranker keeps a copy of each platform's
+candidates in memory, already sorted from most to least bridging, and only reloads
+a platform from Redis when that version changes. A ranking request therefore costs
+a single `GET` of the version (queued on the request's pipeline with
+`queue_version`) rather than a scan, transfer and sort of the whole candidate set.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, Callable
+
+import redis.asyncio
+
+from ranking_server import round_trips
+
+logger = logging.getLogger(__name__)
+
+POSTS_VERSION_KEY = "posts_version"
+CANDIDATE_POSTS_KEY = "candidate_posts_{}"
+
+_NOT_LOADED = object()
+
+
+class CandidateIndex:
+    """Per-platform candidate posts, sorted by descending bridging score.
+
+    Args:
+        redis_client (Callable[[], redis.asyncio.Redis]): Returns the Redis client to load from.
+    """
+
+    def __init__(self, redis_client: Callable[[], redis.asyncio.Redis]):
+        self._redis_client = redis_client
+        self._lock = asyncio.Lock()
+        self._candidates: dict[str, list[dict[str, Any]]] = {}
+        self._ids: dict[str, frozenset[str]] = {}
+        self._versions: dict[str, Any] = {}
+
+    @staticmethod
+    def queue_version(pipe: redis.asyncio.client.Pipeline):
+        """Queue a read of the published version on a pipeline, for `get`."""
+        pipe.get(POSTS_VERSION_KEY)
+
+    async def get(self, platform: str, version: bytes | None) -> list[dict[str, Any]]:
+        """Candidates for a platform, reloading them first if a new version was published.
+
+        The returned list is shared between requests and must not be mutated.
+
+        Args:
+            platform (str): The platform the ranking request came from.
+            version (bytes | None): The published version, as read by `queue_version`.
+
+        Returns:
+            list[dict[str, Any]]: Candidates with `id`, `url` and `bridging_score`.
+        """
+        if self._versions.get(platform, _NOT_LOADED) != version:
+            async with self._lock:
+                # another request may have reloaded while we were waiting
+                if self._versions.get(platform, _NOT_LOADED) != version:
+                    self._candidates[platform], loaded_version = await self._load(platform)
+                    self._ids[platform] = frozenset(x["id"] for x in self._candidates[platform])
+                    self._versions[platform] = loaded_version
+                    logger.info(
+                        f"Loaded {len(self._candidates[platform])} {platform} candidates "
+                        f"(version {loaded_version})"
+                    )
+        return self._candidates[platform]
+
+    def ids(self, platform: str) -> frozenset[str]:
+        """IDs of the candidates last returned by `get` for a platform."""
+        return self._ids[platform]
+
+    async def _load(self, platform: str) -> tuple[list[dict[str, Any]], bytes | None]:
+        # (read the posts and their version in one transaction, so they match)
+        pipe = self._redis_client().pipeline(transaction=True)
+        pipe.hvals(CANDIDATE_POSTS_KEY.format(platform))
+        pipe.get(POSTS_VERSION_KEY)
+        posts, version = await round_trips.execute(pipe)
+        posts = [json.loads(post) for post in posts]
+        candidates = [
+            {
+                "id": post["post_id"],
+                "url": post["url"],
+                "bridging_score": post["bridging_score"],
+            }
+            for post in posts
+        ]
+        # Sort them from most to least bridging.
+        candidates.sort(key=lambda x: x["bridging_score"], reverse=True)
+        return candidates, version
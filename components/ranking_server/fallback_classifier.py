@@ -0,0 +1,66 @@
+"""Lexical civic classifier used when the scorer misses its deadline
+
+The civic model (`scorer_worker.classifiers.areCivic`) runs remotely on the scorer
+workers. When its results do not arrive within the ranker's scoring budget, the
+ranker labels the items with this classifier instead: a lexicon of terms about
+politics, elections or public affairs, in which generic words such as "vote" or
+"campaign" need a second match. It runs in-process in microseconds, at the cost of
+a lower recall than the transformer.
+"""
+
+import os
+import re
+
+# Minimum number of distinct lexicon terms for an item to be labelled civic. A single
+# strong term is always enough on its own.
+FALLBACK_MIN_MATCHES = int(os.getenv("FALLBACK_MIN_MATCHES", 2))
+
+# Terms and phrases that are almost never used outside of politics and public affairs.
+STRONG_CIVIC_TERMS = {
+    "abortion", "bipartisan", "congress", "congressional", "congressman",
+    "congresswoman", "democracy", "democrat", "democrats", "election", "elections",
+    "electoral", "filibuster", "gerrymandering", "gop", "government", "governor",
+    "immigration", "impeachment", "legislation", "legislative", "legislature",
+    "lawmakers", "mayor", "midterm", "midterms", "parliament", "partisan", "politician",
+    "politicians", "political", "politics", "presidential", "referendum", "republican",
+    "republicans", "senate", "senator", "senators", "tariff", "tariffs",
+}
+
+STRONG_CIVIC_PHRASES = {
+    "climate change", "civil rights", "death penalty", "foreign policy", "gun control",
+    "health care", "human rights", "minimum wage", "public policy", "supreme court",
+    "white house",
+}
+
+# Terms that are civic in a political context but common elsewhere too (sports awards,
+# game campaigns, kitchen cabinets, price inflation in a shop...): they only count
+# towards `FALLBACK_MIN_MATCHES` and never label an item civic on their own.
+WEAK_CIVIC_TERMS = {
+    "ballot", "ballots", "cabinet", "campaign", "candidate", "candidates", "caucus",
+    "conservative", "conservatives", "constitution", "constitutional", "democratic",
+    "inflation", "liberal", "liberals", "nominee", "polling", "polls", "president",
+    "primaries", "progressive", "progressives", "voter", "voters", "vote", "votes",
+    "voting",
+}
+
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+def count_civic_terms(text: str) -> tuple[int, int]:
+    """Numbers of distinct strong and weak civic terms and phrases in a text."""
+    words = _WORD_RE.findall(text.lower())
+    bigrams = {f"{a} {b}" for a, b in zip(words, words[1:])}
+    strong = len(STRONG_CIVIC_TERMS.intersection(words))
+    strong += len(STRONG_CIVIC_PHRASES.intersection(bigrams))
+    return strong, len(WEAK_CIVIC_TERMS.intersection(words))
+
+
+def is_civic(text: str) -> bool:
+    """Whether a text has a strong civic term, or enough civic terms in total."""
+    strong, weak = count_civic_terms(text)
+    return strong > 0 or strong + weak >= FALLBACK_MIN_MATCHES
+
+
+def areCivic(texts: list[str]) -> list[bool]:
+    """Label texts as civic or not, mirroring `scorer_worker.classifiers.areCivic`."""
+    return [is_civic(text) for text in texts]
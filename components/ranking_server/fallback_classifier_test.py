@@ -0,0 +1,31 @@
+import pytest
+
+from ranking_server import fallback_classifier
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "The Senate passed the spending bill late last night",
+        "Supreme Court hears arguments on the new case",
+        "Candidates campaign across the state ahead of Tuesday's vote",
+        "The president reshuffled his cabinet after the scandal",
+    ],
+)
+def test_civic_texts(text):
+    assert fallback_classifier.areCivic([text]) == [True]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Vote now for your player of the match!",
+        "The new campaign DLC adds ten hours of story missions",
+        "Flash sale: solid oak cabinet, 30% off today only",
+        "Our candidate for goal of the season: that volley in the 89th minute",
+        "Inflation hit my grocery bill again, any tips for cheap meal prep?",
+        "Check your tyre inflation before the long drive",
+    ],
+)
+def test_single_generic_term_is_not_civic(text):
+    assert fallback_classifier.areCivic([text]) == [False]
@@ -0,0 +1,133 @@
+"""Two-tier cache of civic labels in the ranker
+
+The first tier is an in-process LRU of recently seen texts. The second is the
+Redis cache shared with the scorer workers (see `scorer_worker.label_cache`),
+which the workers fill in as they label items. Only texts that miss both tiers
+need to be sent to the scorer queue. The bridging scores of civic texts are cached
+along with their labels.
+"""
+
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import redis.asyncio
+from scorer_worker.label_cache import cache_key, decode_bridging_score, decode_label
+
+logger = logging.getLogger(__name__)
+
+LABEL_CACHE_LRU_SIZE = int(os.getenv("LABEL_CACHE_LRU_SIZE", 100_000))
+
+# Log cumulative hit rates every time this many more texts have been looked up.
+LABEL_CACHE_REPORT_EVERY = int(os.getenv("LABEL_CACHE_REPORT_EVERY", 1000))
+
+
+@dataclass
+class LabelLookup:
+    keys: list[str]
+    labels: list[bool | None]
+    bridging_scores: list[float | None]
+    missed: list[int] = field(init=False)
+
+    def __post_init__(self):
+        self.missed = [i for i, label in enumerate(self.labels) if label is None]
+
+
+class LabelCache:
+    """Civic labels keyed by text hash and model version.
+
+    Args:
+        lru_size (int): Maximum number of labels kept in process.
+    """
+
+    def __init__(self, lru_size: int = LABEL_CACHE_LRU_SIZE):
+        self._lru: OrderedDict[str, tuple[bool, float | None]] = OrderedDict()
+        self._lru_size = lru_size
+        self.lookups = 0
+        self.lru_hits = 0
+        self.redis_hits = 0
+        self._next_report = LABEL_CACHE_REPORT_EVERY
+
+    def lookup(self, texts: list[str]) -> LabelLookup:
+        """Look up the civic labels of some texts in the in-process tier.
+
+        Labels that are not found can then be read from the shared tier by queueing
+        `queue_shared_lookup` on a pipeline and passing its result to
+        `finish_lookup`.
+
+        Args:
+            texts (list[str]): The texts to look up.
+        """
+        keys = [cache_key(text) for text in texts]
+        entries = [self._lru_get(key) or (None, None) for key in keys]
+        labels = [label for label, _ in entries]
+        self.lru_hits += sum(label is not None for label in labels)
+        self.lookups += len(texts)
+        return LabelLookup(keys, labels, [score for _, score in entries])
+
+    @staticmethod
+    def queue_shared_lookup(pipe: redis.asyncio.client.Pipeline, lookup: LabelLookup) -> bool:
+        """Queue a read of the labels missing from a lookup on a pipeline.
+
+        Returns:
+            bool: Whether anything was queued (nothing is if every label was found).
+        """
+        if len(lookup.missed) == 0:
+            return False
+        pipe.mget([lookup.keys[i] for i in lookup.missed])
+        return True
+
+    def finish_lookup(self, lookup: LabelLookup, values: list[bytes | None]) -> list[bool | None]:
+        """Complete a lookup with the values read from the shared tier.
+
+        The bridging scores found are filled in on `lookup.bridging_scores`.
+
+        Returns:
+            list[bool | None]: The label of each text, or None if it is not cached.
+        """
+        labels = list(lookup.labels)
+        for i, value in zip(lookup.missed, values):
+            label = decode_label(value)
+            if label is not None:
+                labels[i] = label
+                lookup.bridging_scores[i] = decode_bridging_score(value)
+                self._lru_put(lookup.keys[i], label, lookup.bridging_scores[i])
+                self.redis_hits += 1
+
+        if self.lookups >= self._next_report:
+            self._next_report = self.lookups + LABEL_CACHE_REPORT_EVERY
+            logger.info(f"Label cache hit rates: {self.hit_rates()}")
+        return labels
+
+    def put_many(
+        self, texts: list[str], labels: list[bool], bridging_scores: list[float | None]
+    ):
+        """Remember labels and bridging scores computed by the scorer.
+
+        Only the in-process tier is written: the scorer workers write the shared
+        tier themselves.
+        """
+        for text, label, score in zip(texts, labels, bridging_scores):
+            self._lru_put(cache_key(text), label, score)
+
+    def hit_rates(self) -> dict[str, float]:
+        """Fraction of lookups served by each tier, and overall."""
+        lookups = max(self.lookups, 1)
+        return {
+            "lru": self.lru_hits / lookups,
+            "redis": self.redis_hits / lookups,
+            "total": (self.lru_hits + self.redis_hits) / lookups,
+        }
+
+    def _lru_get(self, key: str) -> tuple[bool, float | None] | None:
+        entry = self._lru.get(key)
+        if entry is not None:
+            self._lru.move_to_end(key)
+        return entry
+
+    def _lru_put(self, key: str, label: bool, bridging_score: float | None):
+        self._lru[key] = (label, bridging_score)
+        self._lru.move_to_end(key)
+        if len(self._lru) > self._lru_size:
+            self._lru.popitem(last=False)
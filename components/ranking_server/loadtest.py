@@ -0,0 +1,190 @@
+"""Load-test and replay harness for the /rank endpoint
+
+Replays ranking requests against the ranker at a fixed arrival rate, with a cap on
+the number of requests in flight, and reports latency percentiles, throughput and
+error rate. Run from the `components` directory, e.g.
+
+    python -m ranking_server.loadtest --rate 50 --count 1000 --scorer-latency-ms 80
+
+Requests are read from a JSONL file of `RankingRequest` payloads (`--requests`),
+or generated with `ranking_challenge.fake` if no file is given.
+
+By default the ranker runs in-process and fully offline: Redis is replaced by a
+`fakeredis` instance (plain `fakeredis`: the ranker only uses hashes, sets and
+streams) seeded with synthetic candidate posts, and the Celery scorer is replaced by a stub
+that answers each chunk of items after a configurable latency. This makes ranker
+changes measurable without GPUs or live services. Pass `--url` to load a running
+ranker instead.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+STUB_CIVIC_RATE = 0.3
+
+
+def load_requests(path: str | None, n_posts: int, count: int) -> list[dict]:
+    """Recorded requests from a JSONL file, or `count` synthetic ones."""
+    if path is not None:
+        with open(path) as file:
+            return [json.loads(line) for line in file if line.strip()]
+
+    from ranking_challenge.fake import fake_request
+
+    platforms = ["twitter", "facebook", "reddit"]
+    requests = []
+    for _ in range(min(count, 100)):  # reused round-robin, like repeat visits
+        request = fake_request(n_posts=n_posts, platform=random.choice(platforms))
+        requests.append(json.loads(request.model_dump_json()))
+    return requests
+
+
+def parse_server_timing(header: str | None) -> list[tuple[str, float]]:
+    """(name, milliseconds) pairs from a `Server-Timing` header."""
+    timings = []
+    for metric in (header or "").split(","):
+        name, _, params = metric.strip().partition(";")
+        if params.startswith("dur="):
+            timings.append((name, float(params[len("dur="):])))
+    return timings
+
+
+async def setup_offline_ranker(pool_size: int, scorer_latency_ms: float, scorer_jitter_ms: float):
+    """Import the ranker with fakeredis and a stub scorer in place of live services."""
+    import fakeredis
+
+    import ranking_server.ranking_server as ranker
+    from ranking_server.candidate_index import CANDIDATE_POSTS_KEY
+    from scorer_worker.scorer_basic import SCORING_CHUNK_SIZE
+
+    fake_redis = fakeredis.FakeAsyncRedis()
+    ranker.memoized_redis_client = fake_redis
+
+    pipe = fake_redis.pipeline()
+    for platform in ["twitter", "facebook", "reddit"]:
+        pipe.hset(CANDIDATE_POSTS_KEY.format(platform), mapping={
+            f"{platform}-{i}": json.dumps({
+                "post_id": f"{platform}-{i}",
+                "url": f"https://{platform}.com/{i}",
+                "scraped_at": "",
+                "posted_at": "",
+                "bridging_score": random.random(),
+            })
+            for i in range(pool_size)
+        })
+    pipe.incr("posts_version")
+    await pipe.execute()
+
+    async def stub_scorer(task_name, input, timeout, chunk_size=SCORING_CHUNK_SIZE):
+        # Each chunk finishes after its own latency; chunks that miss the deadline
+        # are left unscored, like in `compute_scores_partial`.
+        latencies = [
+            max(0.0, random.gauss(scorer_latency_ms, scorer_jitter_ms)) / 1000
+            for _ in range(0, len(input), chunk_size)
+        ]
+        await asyncio.sleep(min(max(latencies), timeout))
+        results = []
+        for i, x in enumerate(input):
+            label = None
+            if latencies[i // chunk_size] <= timeout:
+                label = random.random() < STUB_CIVIC_RATE
+            results.append({
+                "item_id": x["item_id"],
+                "label": label,
+                "bridging_score": random.random() if label else None,
+            })
+        return results
+
+    ranker.compute_scores_partial = stub_scorer
+    return ranker.app
+
+
+async def run(args) -> dict:
+    requests = load_requests(args.requests, args.posts, args.count)
+    if args.url is None:
+        app = await setup_offline_ranker(
+            args.pool_size, args.scorer_latency_ms, args.scorer_jitter_ms
+        )
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://ranker")
+    else:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+
+    latencies = []
+    errors = 0
+    scoring_paths = Counter()
+    stage_ms = {}
+    in_flight = asyncio.Semaphore(args.concurrency)
+
+    async def send(payload: dict):
+        nonlocal errors
+        async with in_flight:
+            start = time.perf_counter()
+            try:
+                response = await client.post("/rank", json=payload)
+                response.raise_for_status()
+                scoring_paths[response.headers.get("X-Scoring-Path", "unknown")] += 1
+                for name, duration in parse_server_timing(response.headers.get("Server-Timing")):
+                    stage_ms.setdefault(name, []).append(duration)
+            except Exception:
+                errors += 1
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+    # Open-loop arrivals: requests are sent on schedule whether or not earlier ones
+    # have finished (up to the concurrency cap), so slow responses show up as latency.
+    async with client:
+        start = time.perf_counter()
+        tasks = []
+        for i in range(args.count):
+            delay = start + i / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(requests[i % len(requests)])))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "throughput_rps": len(latencies) / elapsed,
+        "error_rate": errors / max(len(latencies), 1),
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+        "max_ms": max(latencies) * 1000,
+        "scoring_paths": dict(scoring_paths),
+        "mean_stage_ms": {name: statistics.mean(values) for name, values in stage_ms.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", help="JSONL file of RankingRequest payloads to replay")
+    parser.add_argument("--url", help="base URL of a running ranker (default: in-process)")
+    parser.add_argument("--rate", type=float, default=20, help="requests per second")
+    parser.add_argument("--concurrency", type=int, default=100, help="max requests in flight")
+    parser.add_argument("--count", type=int, default=500, help="number of requests to send")
+    parser.add_argument("--posts", type=int, default=50, help="items per synthetic request")
+    parser.add_argument("--timeout", type=float, default=10, help="HTTP timeout (seconds)")
+    parser.add_argument("--pool-size", type=int, default=5000, help="candidates per platform")
+    parser.add_argument("--scorer-latency-ms", type=float, default=50, help="stub scorer latency")
+    parser.add_argument("--scorer-jitter-ms", type=float, default=20, help="stub scorer jitter")
+    parser.add_argument("--log-level", default="WARNING", help="log level of the in-process ranker")
+    args = parser.parse_args()
+    logging.basicConfig()
+    logging.getLogger().setLevel(args.log_level)
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
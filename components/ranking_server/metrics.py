@@ -0,0 +1,132 @@
+"""Per-stage latency instrumentation for the ranker
+
+Each ranking request times its stages with a `StageTimer`. The timings are reported
+to the client in a `Server-Timing` header and accumulated in histograms that are
+exposed, in the Prometheus text format, on the ranker's `/metrics` endpoint.
+"""
+
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the histogram buckets, spanning the 500 ms budget.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """A Prometheus-style histogram, optionally split by the value of one label.
+
+    Args:
+        name (str): Metric name.
+        description (str): Help text for the metric.
+        label (str | None): Name of the label that splits the histogram, if any.
+        buckets (tuple[float, ...]): Upper bounds of the buckets.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label: str | None = None,
+        buckets: tuple[float, ...] = BUCKETS,
+    ):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = buckets
+        self._counts: dict[str | None, list[int]] = {}
+        self._sums: dict[str | None, float] = {}
+
+    def observe(self, value: float, label_value: str | None = None):
+        counts = self._counts.setdefault(label_value, [0] * (len(self.buckets) + 1))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self._sums[label_value] = self._sums.get(label_value, 0.0) + value
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for label_value, counts in self._counts.items():
+            labels = "" if self.label is None else f'{self.label}="{label_value}",'
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{labels}le="{le}"}} {cumulative}')
+            labels = "" if self.label is None else f'{{{self.label}="{label_value}"}}'
+            lines.append(f"{self.name}_sum{labels} {self._sums[label_value]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "ranker_request_seconds", "Time to handle a ranking request, from arrival to response."
+)
+STAGE_SECONDS = Histogram(
+    "ranker_stage_seconds", "Time spent in each stage of a ranking request.", label="stage"
+)
+REDIS_ROUND_TRIPS = Histogram(
+    "ranker_redis_round_trips",
+    "Redis round-trips per ranking request, including the request log written after the "
+    "response.",
+    buckets=(1, 2, 3, 5, 10),
+)
+
+
+class StageTimer:
+    """Times the stages of a single ranking request."""
+
+    def __init__(self):
+        self.durations: dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def observe(self, total_seconds: float):
+        """Add the request's timings to the histograms."""
+        REQUEST_SECONDS.observe(total_seconds)
+        for name, seconds in self.durations.items():
+            STAGE_SECONDS.observe(seconds, name)
+
+    def server_timing(self) -> str:
+        """The timings as a `Server-Timing` header value (in milliseconds)."""
+        return ", ".join(
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.durations.items()
+        )
+
+
+class ArrivalTimeMiddleware:
+    """Pure ASGI middleware that records when each request arrived.
+
+    The time is available to handlers as `request.state.arrival_time`, so that the
+    time spent reading and validating the request body can be measured.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["arrival_time"] = time.perf_counter()
+        await self.app(scope, receive, send)
+
+
+def expose(*extra_lines: str) -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = (
+        REQUEST_SECONDS.expose()
+        + STAGE_SECONDS.expose()
+        + REDIS_ROUND_TRIPS.expose()
+        + list(extra_lines)
+    )
+    return "\n".join(lines) + "\n"
@@ -5,14 +5,27 @@
 import logging
 import os
 import json
-from concurrent.futures.thread import ThreadPoolExecutor
+import time
 
-import redis
-from fastapi import FastAPI
+import redis.asyncio
+from fastapi import BackgroundTasks, FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
 # from fastapi.middleware.cors import CORSMiddleware
 from ranking_challenge.request import RankingRequest
 from ranking_challenge.response import RankingResponse
-from scorer_worker.scorer_basic import compute_scores as compute_scores_basic
+from scorer_worker.scorer_basic import compute_scores_partial
+
+from ranking_server import fallback_classifier, round_trips
+from ranking_server.candidate_index import CandidateIndex
+from ranking_server.label_cache import LabelCache
+from ranking_server.metrics import (
+    REDIS_ROUND_TRIPS,
+    STAGE_SECONDS,
+    ArrivalTimeMiddleware,
+    StageTimer,
+    expose,
+)
+from ranking_server.replacement import replace_civic_items
 
 
 # ------------------------------------------------------------------------------
@@ -28,11 +41,23 @@ logger.info("Starting up")
 
 REDIS_DB = f"{os.getenv('REDIS_CONNECTION_STRING', 'redis://database:6379')}/0"
 
+# How long to wait for civic labels from the scorer workers before labelling the
+# items with the in-process fallback classifier instead. Leaves headroom within
+# the challenge's 500 ms budget for the rest of the request.
+SCORING_DEADLINE_SECONDS = float(os.getenv("SCORING_DEADLINE_SECONDS", 0.35))
+
+# Ranking requests are logged to this stream for `sync_databases` to process. It is
+# trimmed (approximately) to this many entries so it cannot grow without bound if
+# the sync falls behind; 0 disables trimming.
+RANKING_REQUESTS_STREAM = "ranking_requests_stream"
+RANKING_REQUESTS_MAXLEN = int(os.getenv("RANKING_REQUESTS_MAXLEN", 1_000_000))
+
 app = FastAPI(
     title="feed-span",
     description="Entry for the Prosocial Ranking Challenge.",
     version="1.0.0",
 )
+app.add_middleware(ArrivalTimeMiddleware)
 
 # Set up CORS. This is necessary if calling this code directly from a
 # browser extension, but if you're not doing that, you won't need this.
@@ -47,127 +72,180 @@ app = FastAPI(
 memoized_redis_client = None
 
 
-def redis_client():
+def redis_client() -> redis.asyncio.Redis:
+    """Asyncio Redis client, sharing one connection pool between all requests."""
     global memoized_redis_client
     if memoized_redis_client is None:
-        memoized_redis_client = redis.Redis.from_url(REDIS_DB)
+        memoized_redis_client = redis.asyncio.Redis.from_url(REDIS_DB)
     return memoized_redis_client
 
 
+candidate_index = CandidateIndex(redis_client)
+label_cache = LabelCache()
+
+
+async def log_ranking_request(request_log: dict):
+    """Append a ranking request to the log processed by `sync_databases`.
+
+    Runs after the response has been sent, so it also records the request's Redis
+    round-trips: the ones made before the response (`redis_round_trips` in the log),
+    plus this write.
+    """
+    pipe = redis_client().pipeline(transaction=False)
+    pipe.xadd(
+        RANKING_REQUESTS_STREAM,
+        {"request": json.dumps(request_log)},
+        maxlen=RANKING_REQUESTS_MAXLEN or None,
+        approximate=True,
+    )
+    start = time.perf_counter()
+    try:
+        await round_trips.execute(pipe)
+    except Exception as e:
+        logger.error(f"Error logging ranking request: {e}")
+    STAGE_SECONDS.observe(time.perf_counter() - start, "log_write")
+    REDIS_ROUND_TRIPS.observe(request_log["redis_round_trips"] + 1)
+
+
 # ------------------------------------------------------------------------------
 # RANKER
 
 @app.post("/rank")
-def rank(ranking_request: RankingRequest) -> RankingResponse:
+async def rank(
+    ranking_request: RankingRequest,
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
+) -> RankingResponse:
 
     logger.info("Received ranking request")
+    round_trips.reset()
+    timer = StageTimer()
+    timer.record("parse", time.perf_counter() - request.state.arrival_time)
     
     # Extract request parameters.
     
     items = ranking_request.items
     session = ranking_request.session
 
+    # Read everything the request needs from Redis in a single round-trip: the
+    # version of the candidate posts, the posts already recommended to user, and
+    # any civic labels that are cached in Redis but not in process.
+
+    with timer.stage("redis_read"):
+        lookup = label_cache.lookup([item.text for item in items])
+        pipe = redis_client().pipeline(transaction=False)
+        CandidateIndex.queue_version(pipe)
+        pipe.smembers(f"recommended_{session.platform}_{session.user_id}")
+        label_cache.queue_shared_lookup(pipe, lookup)
+        posts_version, already_recommended, *shared_labels = await round_trips.execute(pipe)
+        cached_labels = label_cache.finish_lookup(lookup, shared_labels[0] if shared_labels else [])
+        already_recommended = {post_id.decode() for post_id in already_recommended}
+
     # Run civic classifier.
 
     #items_text = [item.text for item in items] 
     #items_civic_status = areCivic(items_text) # runs scoring on ranker, as backup
 
-    with ThreadPoolExecutor() as executor:
-        data = [{"item_id": x.id, "text": x.text} for x in ranking_request.items]
-        future = executor.submit(compute_scores_basic, "scorer_worker.tasks.civic_labeller_list", data)
-        try:
-            logger.info("Submitting score computation task")
-            scoring_result = future.result(timeout=5) # needs to be 0.5
-        except TimeoutError:
-            logger.error("Timed out waiting for score results")
-        except Exception as e:
-            logger.error(f"Error computing scores: {e}")
-        else:
-            logger.info(f"Computed scores: {scoring_result}")
-    
-    items_civic_status = [item['label'] for item in scoring_result]  
-
-    # Fetch bridging posts from Redis. (that have not already been recommended to user)
-
-    replacement_candidates = redis_client().execute_command(
-      'JSON.GET', # Redis command
-      f"posts_{session.platform}", # Redis key
-      f"$[?(@.recommended_to[*] != '{session.user_id}')]" # JSONPath filters
-    )
-
-    if type(replacement_candidates) != 'list':
-        replacement_candidates = []
+    # (only items whose labels are not already cached are sent to the scorer)
 
+    remote_labels = {
+        item.id: label for item, label in zip(items, cached_labels) if label is not None
+    }
+    bridging_scores = {
+        item.id: score for item, score in zip(items, lookup.bridging_scores) if score is not None
+    }
 
-    # Sort them from most to least bridging.
-    replacement_candidates = sorted(
-        replacement_candidates,
-        key=lambda x: x['bridging_score'],
-        reverse = True
-    )
-    inventory_available = len(replacement_candidates)
-    
-    # Replace civic posts with bridging (civic) posts.
-    item_ids = [item.id for item in items]
-    civic_post_ids = [id for id, is_civic in zip(item_ids, items_civic_status) if is_civic]
-    inventory_required = len(civic_post_ids)
-
-    counter = 0
-    ranked_ids = []
-    inserted_posts = []
-
-    changelog = []
-
-    for id in item_ids:
-        if id in civic_post_ids and len(replacement_candidates) > 0:
-            candidate = replacement_candidates.pop(0)
-            if candidate['id'] not in item_ids: # deduplication
-                ranked_ids.append(candidate['id'])
-                inserted_posts.append({
-                    "id": candidate['id'],
-                    "url": candidate['url']
-                })
-                changelog.append({
-                    "id_removed": id,
-                    "id_inserted": candidate['id'],
-                    "bridging_score_inserted": candidate['bridging_score']
-                })
-                counter += 1
+    data = [{"item_id": x.id, "text": x.text} for x in items if x.id not in remote_labels]
+    scoring_result = []
+    if len(data) > 0:
+        with timer.stage("score"):
+            try:
+                logger.info(f"Submitting score computation tasks ({len(data)} uncached items)")
+                # Whatever was scored by the deadline; the rest are marked with no label.
+                scoring_result = await compute_scores_partial(
+                    "scorer_worker.tasks.civic_labeller_list",
+                    data,
+                    timeout=SCORING_DEADLINE_SECONDS,
+                )
+            except Exception as e:
+                logger.error(f"Error computing scores: {e}")
             else:
-                ranked_ids.append(id)
-        else:
-            ranked_ids.append(id)
-
-
-    # If proportion of civic content less than a threshold, insert additional
-    # bridging posts.
-    
-    if counter < int(0.1 * len(item_ids)): # less than 10% dose size
-        # insert more
-        diff = int(0.1 * len(item_ids)) - counter
-        inventory_required += diff
-        for num in range(diff):
-            if len(replacement_candidates) > 0:
-                candidate = replacement_candidates.pop(0)
-                if candidate['id'] not in ranked_ids: # deduplication
-                    ranked_ids.append(candidate['id'])
-                    inserted_posts.append({
-                        "id": candidate['id'],
-                        "url": candidate['url']
-                    })
-                    changelog.append({
-                        "id_removed": None,
-                        "id_inserted": candidate['id'],
-                        "bridging_score_inserted": candidate['bridging_score'],
-                    })
-                    counter += 1
-
+                scoring_result = [x for x in scoring_result if x['label'] is not None]
+                logger.info(f"Computed scores for {len(scoring_result)} of {len(data)} items")
+                logger.debug(f"Computed scores: {scoring_result}")
+
+    texts_by_id = {item.id: item.text for item in items}
+    label_cache.put_many(
+        [texts_by_id[x['item_id']] for x in scoring_result],
+        [x['label'] for x in scoring_result],
+        [x.get('bridging_score') for x in scoring_result],
+    )
+    remote_labels.update({x['item_id']: x['label'] for x in scoring_result})
+    bridging_scores.update({
+        x['item_id']: x['bridging_score']
+        for x in scoring_result if x.get('bridging_score') is not None
+    })
+
+    # Label any items the scorer did not return with the fallback classifier, and
+    # record which path produced the labels. (Cached labels came from the scorer.)
+
+    with timer.stage("fallback"):
+        unscored_items = [item for item in items if item.id not in remote_labels]
+        fallback_labels = dict(zip(
+            [item.id for item in unscored_items],
+            fallback_classifier.areCivic([item.text for item in unscored_items]),
+        ))
+        items_civic_status = [
+            remote_labels[item.id] if item.id in remote_labels else fallback_labels[item.id]
+            for item in items
+        ]
+
+    if len(unscored_items) == 0:
+        scoring_path = "remote"
+    elif len(unscored_items) == len(items):
+        scoring_path = "fallback"
+    else:
+        scoring_path = "mixed"
+    response.headers["X-Scoring-Path"] = scoring_path
+
+    # Fetch bridging posts, already sorted from most to least bridging. (Only
+    # costs another round-trip, and a sort, when a new version of the posts was
+    # published.)
+
+    with timer.stage("candidates"):
+        candidates = await candidate_index.get(session.platform, posts_version)
+        inventory_available = (
+            len(candidates) - len(already_recommended & candidate_index.ids(session.platform))
+        )
+
+    # Replace civic posts with bridging (civic) posts, topping up to the dose size.
+
+    with timer.stage("replace"):
+        item_ids = [item.id for item in items]
+        feed = replace_civic_items(item_ids, items_civic_status, candidates, already_recommended)
+    ranked_ids = feed.ranked_ids
+    inserted_posts = feed.inserted_posts
+    changelog = feed.changelog
+    inventory_required = feed.inventory_required
+
+    # Log the bridging scores of the removed items, computed by the scorer along
+    # with their labels (None for items labelled by the fallback classifier).
+
+    for change in changelog:
+        if change["id_removed"] is not None:
+            change["bridging_score_removed"] = bridging_scores.get(change["id_removed"])
 
-    
     # Mark posts as recommended_to user in Redis.
     # (Here we just log the details of the ranking request to Redis. The sandbox
-    #  worker then merges these into postgres and updates the recommended_to
-    #  field.)
+    #  worker then records the recommendations in postgres. The log is written
+    #  after the response has been sent, so the request only waits on the
+    #  round-trips above, which are all the header and the log report; the
+    #  histogram also counts the log write.)
+
+    response.headers["X-Redis-Round-Trips"] = str(round_trips.count())
+    response.headers["Server-Timing"] = timer.server_timing()
+    timer.observe(time.perf_counter() - request.state.arrival_time)
 
     request_log = {
         "user_id": session.user_id,
@@ -177,15 +255,10 @@ def rank(ranking_request: RankingRequest) -> RankingResponse:
         "changelog": changelog,
         "inventory_available": inventory_available,
         "inventory_required": inventory_required,
+        "scoring_path": scoring_path,
+        "redis_round_trips": round_trips.count(),
     }
-    if not redis_client().exists("ranking_requests"):
-        redis_client().json().set( "ranking_requests",  "$", [] )
-    redis_client().execute_command(
-        'JSON.ARRAPPEND', # Redis command
-        f"ranking_requests", # Redis key
-        "$", # Redis JSON path
-        json.dumps(request_log)
-    )
+    background_tasks.add_task(log_ranking_request, request_log)
 
     # TODO: Logging.
     # TODO: Error checking.
@@ -197,3 +270,22 @@ def rank(ranking_request: RankingRequest) -> RankingResponse:
     }
 
     return RankingResponse(**result)
+
+
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    """Latency histograms and label cache statistics, in the Prometheus text format.
+
+    (Runs on the event loop, like the requests that update the histograms, so that it
+    never reads them while they are being written.)
+    """
+    hit_rates = label_cache.hit_rates()
+    cache_lines = [
+        "# HELP ranker_label_cache_hit_rate Fraction of civic label lookups served by the cache.",
+        "# TYPE ranker_label_cache_hit_rate gauge",
+        *[
+            f'ranker_label_cache_hit_rate{{tier="{tier}"}} {rate}'
+            for tier, rate in hit_rates.items()
+        ],
+    ]
+    return PlainTextResponse(expose(*cache_lines))
@@ -0,0 +1,96 @@
+"""Replacement of civic items with bridging posts
+
+This is the core of the ranker, kept free of any I/O so that it can be tested and
+benchmarked on its own (see `ranking_server.bench_replacement`).
+
+Each civic item in the feed is replaced, in place, with the most bridging
+candidate that has not been recommended to the user yet and is not already in the
+feed. If fewer than `dose` of the feed's items were replaced, more candidates are
+appended to the end of the feed to make up the difference.
+
+Candidates are consumed through a single cursor and all membership checks are
+against sets, so the cost is linear in the size of the feed and independent of the
+size of the candidate pool.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator
+
+# Minimum proportion of the feed that should be bridging posts.
+DOSE = 0.1
+
+
+@dataclass
+class RankedFeed:
+    ranked_ids: list[str] = field(default_factory=list)
+    inserted_posts: list[dict[str, Any]] = field(default_factory=list)
+    changelog: list[dict[str, Any]] = field(default_factory=list)
+    inventory_required: int = 0
+
+
+def _available_candidates(
+    candidates: Iterable[dict[str, Any]], in_feed: set[str], already_recommended: set[str]
+) -> Iterator[dict[str, Any]]:
+    for candidate in candidates:
+        if candidate["id"] not in in_feed and candidate["id"] not in already_recommended:
+            in_feed.add(candidate["id"])  # never insert the same candidate twice
+            yield candidate
+
+
+def replace_civic_items(
+    item_ids: list[str],
+    civic_status: list[bool],
+    candidates: Iterable[dict[str, Any]],
+    already_recommended: set[str] = frozenset(),
+    dose: float = DOSE,
+) -> RankedFeed:
+    """Replace civic items with bridging posts, and top up the feed to the dose.
+
+    Args:
+        item_ids (list[str]): IDs of the items in the feed, in their original order.
+        civic_status (list[bool]): Whether each item is civic.
+        candidates (Iterable[dict[str, Any]]): Bridging posts with `id`, `url` and
+                                               `bridging_score`, from most to least
+                                               bridging. Only consumed as far as needed.
+        already_recommended (set[str]): IDs of posts the user has already been shown.
+        dose (float): Minimum proportion of the feed that should be bridging posts.
+
+    Returns:
+        RankedFeed: The new order of the feed, the posts inserted into it, a log of
+                    what replaced what, and how many candidates the feed called for.
+    """
+    feed = RankedFeed()
+    cursor = _available_candidates(candidates, set(item_ids), already_recommended)
+
+    def insert(candidate: dict[str, Any], id_removed: str | None):
+        feed.ranked_ids.append(candidate["id"])
+        feed.inserted_posts.append({"id": candidate["id"], "url": candidate["url"]})
+        feed.changelog.append({
+            "id_removed": id_removed,
+            "id_inserted": candidate["id"],
+            "bridging_score_inserted": candidate["bridging_score"],
+        })
+
+    # Replace civic posts with bridging (civic) posts.
+
+    for item_id, is_civic in zip(item_ids, civic_status):
+        candidate = next(cursor, None) if is_civic else None
+        if candidate is None:
+            feed.ranked_ids.append(item_id)
+        else:
+            insert(candidate, item_id)
+    feed.inventory_required = sum(civic_status)
+
+    # If proportion of civic content less than a threshold, insert additional
+    # bridging posts.
+
+    shortfall = int(dose * len(item_ids)) - len(feed.changelog)
+    if shortfall > 0:
+        feed.inventory_required += shortfall
+        for _ in range(shortfall):
+            candidate = next(cursor, None)
+            if candidate is None:
+                break
+            insert(candidate, None)
+
+    return feed
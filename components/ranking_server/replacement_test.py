@@ -0,0 +1,80 @@
+import pytest
+
+from ranking_server.bench_replacement import legacy_replace, make_inputs
+from ranking_server.replacement import replace_civic_items
+
+
+def candidate(post_id: str, bridging_score: float = 0.5) -> dict:
+    return {
+        "id": post_id, "url": f"https://example.com/{post_id}", "bridging_score": bridging_score
+    }
+
+
+@pytest.mark.parametrize("feed_size", [1, 10, 20, 200])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_matches_legacy_replacement(feed_size, seed):
+    item_ids, civic_status, candidates, already_recommended = make_inputs(feed_size, 500, seed)
+    feed = replace_civic_items(item_ids, civic_status, candidates, already_recommended)
+    assert feed.ranked_ids == legacy_replace(
+        item_ids, civic_status, candidates, already_recommended
+    )
+
+
+def test_replaces_civic_items_in_place():
+    feed = replace_civic_items(
+        ["a", "b", "c"], [True, False, True], [candidate("x", 0.9), candidate("y", 0.8)]
+    )
+    assert feed.ranked_ids == ["x", "b", "y"]
+    assert feed.inserted_posts == [
+        {"id": "x", "url": "https://example.com/x"},
+        {"id": "y", "url": "https://example.com/y"},
+    ]
+    assert feed.changelog == [
+        {"id_removed": "a", "id_inserted": "x", "bridging_score_inserted": 0.9},
+        {"id_removed": "c", "id_inserted": "y", "bridging_score_inserted": 0.8},
+    ]
+    assert feed.inventory_required == 2
+
+
+def test_keeps_civic_items_when_candidates_run_out():
+    feed = replace_civic_items(["a", "b", "c"], [True, True, True], [candidate("x")])
+    assert feed.ranked_ids == ["x", "b", "c"]
+    assert feed.inventory_required == 3
+
+
+def test_skips_candidates_already_in_feed():
+    # (the legacy loop kept the civic item instead, and used up the candidate)
+    feed = replace_civic_items(
+        ["a", "b", "c"], [True, False, False], [candidate("b"), candidate("x")]
+    )
+    assert feed.ranked_ids == ["x", "b", "c"]
+
+
+def test_skips_candidates_already_recommended():
+    feed = replace_civic_items(
+        ["a", "b"], [True, True], [candidate("x"), candidate("y"), candidate("z")], {"x", "z"}
+    )
+    assert feed.ranked_ids == ["y", "b"]
+
+
+def test_never_inserts_a_candidate_twice():
+    feed = replace_civic_items(["a", "b"], [True, True], [candidate("x"), candidate("x")])
+    assert feed.ranked_ids == ["x", "b"]
+
+
+def test_tops_up_to_dose():
+    item_ids = [f"item{i}" for i in range(20)]
+    feed = replace_civic_items(
+        item_ids, [False] * 20, [candidate("x"), candidate("y"), candidate("z")], dose=0.1
+    )
+    assert feed.ranked_ids == item_ids + ["x", "y"]
+    assert [change["id_removed"] for change in feed.changelog] == [None, None]
+    assert feed.inventory_required == 2
+
+
+def test_replacements_count_towards_dose():
+    item_ids = [f"item{i}" for i in range(20)]
+    civic_status = [i == 0 for i in range(20)]
+    feed = replace_civic_items(item_ids, civic_status, [candidate("x"), candidate("y")], dose=0.1)
+    assert feed.ranked_ids == ["x"] + item_ids[1:] + ["y"]
+    assert feed.inventory_required == 2
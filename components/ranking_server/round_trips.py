@@ -0,0 +1,33 @@
+"""Counting of Redis round-trips per ranking request
+
+Every round-trip to Redis costs a full network latency, so the ranker batches all
+the Redis reads a request needs into a single pipeline. All Redis access from the
+ranker goes through `execute`, which counts round-trips in a context variable, so
+that each request can report how many it made and regressions are visible.
+
+The `X-Redis-Round-Trips` header and the `redis_round_trips` field of the request
+log count the round-trips made before the response; the `ranker_redis_round_trips`
+histogram also counts the request log, written after the response.
+"""
+
+from contextvars import ContextVar
+
+import redis.asyncio
+
+_round_trips: ContextVar[int] = ContextVar("redis_round_trips", default=0)
+
+
+def reset():
+    """Start counting round-trips for a new request."""
+    _round_trips.set(0)
+
+
+def count() -> int:
+    """Number of round-trips made since the last `reset` in the current context."""
+    return _round_trips.get()
+
+
+async def execute(pipe: redis.asyncio.client.Pipeline) -> list:
+    """Execute a pipeline as a single, counted round-trip."""
+    _round_trips.set(_round_trips.get() + 1)
+    return await pipe.execute()
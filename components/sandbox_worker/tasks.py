@@ -1,12 +1,18 @@
 import json
 import logging
 import os
+import socket
+import time
 
 import psycopg2
 import redis
+from psycopg2 import sql
+from psycopg2.extras import execute_values
 from util.scheduler import ScheduledTask, schedule_tasks
 
-from sandbox_worker.classifiers import isCivic, getBridgeScore
+from celery.signals import worker_init
+from inference import models
+from sandbox_worker.classifiers import areCivic, getBridgeScores
 
 from sandbox_worker.celery_app import app
 import scraper_worker.sql_statements as my_sql
@@ -22,47 +28,254 @@ REDIS_DB = f"{os.getenv('REDIS_CONNECTION_STRING', 'redis://localhost:6379')}/0"
 DB_URI = os.getenv("SCRAPER_DB_URI")
 assert DB_URI, "SCRAPER_DB_URI environment variable must be set"
 
+# Candidate posts are kept in Redis per platform (see `refresh_posts_in_redis`,
+# and `ranking_server.candidate_index`, which reads them).
+PLATFORMS = ["twitter", "facebook", "reddit"]
+CANDIDATE_POSTS_KEY = "candidate_posts_{}"
+CANDIDATE_SCRAPED_AT_KEY = "candidate_posts_{}_scraped_at"
+CANDIDATE_WATERMARK_KEY = "candidate_posts_watermark"
+CANDIDATE_REBUILT_AT_KEY = "candidate_posts_rebuilt_at"
+CANDIDATE_BUILD_KEY = "candidate_posts_build"
+CANDIDATE_SYNC_LOCK_KEY = "candidate_posts_sync_lock"
+POSTS_VERSION_KEY = "posts_version"
+CANDIDATE_POOL_SIZE = int(os.getenv("CANDIDATE_POOL_SIZE", 5000))
+CANDIDATE_FULL_REBUILD_SECONDS = int(os.getenv("CANDIDATE_FULL_REBUILD_SECONDS", 24 * 60 * 60))
+CANDIDATE_SYNC_OVERLAP_SECONDS = int(os.getenv("CANDIDATE_SYNC_OVERLAP_SECONDS", 60))
+
+# Number of unclassified posts fetched, classified and written back at a time.
+CLASSIFY_CHUNK_SIZE = int(os.getenv("CLASSIFY_CHUNK_SIZE", 512))
+
+# Posts claimed for classification by a worker that has not classified them after
+# this long are claimed by the next worker.
+CLASSIFY_LEASE_SECONDS = int(os.getenv("CLASSIFY_LEASE_SECONDS", 10 * 60))
+
+# Number of workers `process_scraped_posts` shares the classification work with
+# (itself included), one task each.
+CLASSIFY_PARALLELISM = int(os.getenv("CLASSIFY_PARALLELISM", 1))
+
+# How long a user's set of already-recommended posts is kept after their most
+# recent recommendation. Candidates are at most a few days old, so there is no
+# need to remember recommendations for longer than that.
+RECOMMENDED_TTL_SECONDS = int(os.getenv("RECOMMENDED_TTL_SECONDS", 30 * 24 * 60 * 60))
+
+# The ranker logs every ranking request to this stream, and `sync_databases` drains
+# it through a consumer group, so that more than one worker can share the work.
+RANKING_REQUESTS_STREAM = "ranking_requests_stream"
+RANKING_REQUESTS_GROUP = "sync_databases"
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", 500))
+
+# Requests delivered to a worker that has not acknowledged them after this long
+# (e.g. because it died part way through a batch) are claimed by the next worker.
+SYNC_CLAIM_IDLE_MS = int(os.getenv("SYNC_CLAIM_IDLE_MS", 10 * 60 * 1000))
+
+
+@worker_init.connect
+def warm_up_models(**kwargs):
+    """Load the classifiers before the worker starts consuming tasks."""
+    models.warm_up()
+
+
+_posts_table_upgraded = False
+
+
+def upgrade_posts_table(con):
+    """Add the columns the sandbox worker needs to the posts table, once per process."""
+    global _posts_table_upgraded
+    if _posts_table_upgraded:
+        return
+    cur = con.cursor()
+    cur.execute(my_sql.POSTGRES_UPGRADE_TABLE_POSTS.format(table_name="posts"))
+    con.commit()
+    _posts_table_upgraded = True
+
+
+def candidate_post(row: tuple) -> tuple[str, float, str]:
+    """The ID, sort score (`scraped_at`) and stored JSON of a candidate post."""
+    post_id, url, scraped_at, posted_at, bridging_score = row[:5]
+    post = {
+        'post_id': post_id,
+        'url': url,
+        'scraped_at': str(scraped_at),
+        'posted_at': str(posted_at),
+        'bridging_score': bridging_score,
+    }
+    return post_id, scraped_at.timestamp(), json.dumps(post)
+
+
+def rebuild_candidates(cur, r: redis.Redis):
+    """Rebuild every platform's candidate posts in Redis from scratch.
+
+    The posts are written to keys of their own, and swapped in for the live ones
+    (and a new version published) in one MULTI/EXEC transaction.
+    """
+    cur.execute("SELECT NOW();")
+    watermark = cur.fetchone()[0]
+    build = r.incr(CANDIDATE_BUILD_KEY)
+
+    staged = []
+    pipe = r.pipeline(transaction=False)
+    for platform in PLATFORMS:
+        cur.execute(
+            """
+            SELECT post_id, url, scraped_at, posted_at, bridging_score FROM posts
+            WHERE platform = %s AND is_classified = TRUE AND is_civic = TRUE
+            ORDER BY scraped_at DESC LIMIT %s;
+            """,
+            (platform, CANDIDATE_POOL_SIZE),
+        )
+        posts = [candidate_post(row) for row in cur.fetchall()]
+        keys = (CANDIDATE_POSTS_KEY.format(platform), CANDIDATE_SCRAPED_AT_KEY.format(platform))
+        if len(posts) > 0:
+            # (staging keys expire, in case the rebuild dies before swapping them in)
+            pipe.hset(f"{keys[0]}:{build}", mapping={p: post for p, _, post in posts})
+            pipe.zadd(f"{keys[1]}:{build}", {p: score for p, score, _ in posts})
+            pipe.expire(f"{keys[0]}:{build}", CANDIDATE_FULL_REBUILD_SECONDS)
+            pipe.expire(f"{keys[1]}:{build}", CANDIDATE_FULL_REBUILD_SECONDS)
+        staged.append((keys, len(posts) > 0))
+    pipe.execute()
+
+    pipe = r.pipeline()
+    for keys, any_posts in staged:
+        for key in keys:
+            if any_posts:
+                pipe.rename(f"{key}:{build}", key)
+                pipe.persist(key)
+            else:
+                pipe.delete(key)
+    pipe.set(CANDIDATE_WATERMARK_KEY, watermark.isoformat())
+    pipe.set(CANDIDATE_REBUILT_AT_KEY, time.time())
+    pipe.incr(POSTS_VERSION_KEY)
+    pipe.execute()
+    logger.info(f"Rebuilt the candidate posts (build {build})")
+
+
+def sync_candidate_changes(cur, r: redis.Redis, watermark: str) -> int | None:
+    """Apply the posts changed since the watermark to the candidate posts in Redis.
+
+    New and changed civic posts are added, posts no longer civic are removed, and
+    the oldest posts beyond `CANDIDATE_POOL_SIZE` are evicted, in one MULTI/EXEC
+    transaction that also publishes a new version. Only the changed posts, and as
+    many of the oldest candidates, are read.
 
-def refresh_posts_in_redis():
+    Returns:
+        int | None: The number of changed posts, or None if nothing was applied
+                    because removals left a pool short, and the posts that should
+                    take their place can only be found by a rebuild.
+    """
+    # (posts updated by transactions that committed after the last sync read its
+    # changes may carry an earlier `updated_at`, so the watermark is overlapped;
+    # applying a change twice is harmless)
+    cur.execute(
+        """
+        SELECT post_id, url, scraped_at, posted_at, bridging_score, platform,
+            is_classified AND is_civic, updated_at
+        FROM posts
+        WHERE updated_at > %s::timestamptz - %s * INTERVAL '1 second'
+        ORDER BY updated_at;
+        """,
+        (watermark, CANDIDATE_SYNC_OVERLAP_SECONDS),
+    )
+    rows = cur.fetchall()
+    if len(rows) == 0:
+        return 0
+
+    pipe = r.pipeline()
+    for platform in PLATFORMS:
+        posts_key = CANDIDATE_POSTS_KEY.format(platform)
+        scraped_at_key = CANDIDATE_SCRAPED_AT_KEY.format(platform)
+        upserts = [candidate_post(row) for row in rows if row[5] == platform and row[6]]
+        removals = {row[0] for row in rows if row[5] == platform and not row[6]}
+        if len(upserts) + len(removals) == 0:
+            continue
+
+        # Work out which posts fall out of the pool: they can only be the changed
+        # posts, or among the oldest current candidates.
+        ids = [p for p, _, _ in upserts] + list(removals)
+        current = dict(zip(ids, r.zmscore(scraped_at_key, ids)))
+        pool_size = r.zcard(scraped_at_key)
+        removed = sum(current[p] is not None for p in removals)
+        size = pool_size + sum(current[p] is None for p, _, _ in upserts) - removed
+        excess = max(size - CANDIDATE_POOL_SIZE, 0)
+        evicted = []
+        oldest = {}
+        if excess > 0 or removed > 0:
+            oldest = dict(r.zrange(scraped_at_key, 0, excess + len(ids) - 1, withscores=True))
+            oldest = {p.decode(): score for p, score in oldest.items()}
+        pool_min = min(oldest.values(), default=None)
+        if excess > 0:
+            oldest.update({p: score for p, score, _ in upserts})
+            for p in removals:
+                oldest.pop(p, None)
+            evicted = sorted(oldest, key=lambda p: (oldest[p], p))[:excess]
+
+        # Posts evicted earlier are no older than the oldest candidate, and are not
+        # read back: if a full pool loses posts, it needs a rebuild unless newer
+        # posts take their place.
+        if removed > 0 and pool_size >= CANDIDATE_POOL_SIZE:
+            added = [
+                score for p, score, _ in upserts if current[p] is None and p not in evicted
+            ]
+            if size < CANDIDATE_POOL_SIZE or any(score <= pool_min for score in added):
+                return None
+
+        if len(upserts) > 0:
+            pipe.hset(posts_key, mapping={p: post for p, _, post in upserts})
+            pipe.zadd(scraped_at_key, {p: score for p, score, _ in upserts})
+        gone = list(removals) + evicted
+        if len(gone) > 0:
+            pipe.hdel(posts_key, *gone)
+            pipe.zrem(scraped_at_key, *gone)
+
+    pipe.set(CANDIDATE_WATERMARK_KEY, rows[-1][7].isoformat())
+    pipe.incr(POSTS_VERSION_KEY)
+    pipe.execute()
+    return len(rows)
+
+
+def refresh_posts_in_redis(full: bool = False):
     """
     This function updates the candidate bridging posts stored in Redis, along
     with their metadata, from the complete set of posts stored in Postgres.
 
     It is intended to be run whenever Postgres gets updated in order to sync
-    any changes to Redis.
+    any changes to Redis. Only the posts updated since the last sync are read and
+    written, and rankers only reload their candidates if there were any; the
+    candidates are rebuilt from scratch the first time, when `full` is set, and
+    every `CANDIDATE_FULL_REBUILD_SECONDS`.
+
+    Each platform's candidates are kept as a hash of post ID to post JSON, next to
+    a sorted set of the post IDs by `scraped_at`, which decides which posts are
+    evicted. Every change is applied in a single MULTI/EXEC transaction, so readers
+    never see a half-written candidate set.
     """
 
     con = psycopg2.connect(DB_URI)
-    cur = con.cursor()
     r = redis.Redis.from_url(REDIS_DB)
 
-    # Fetch posts from postgres.
-
-    posts = {}
-
-    for platform in ["twitter", "facebook", "reddit"]:
-        query = f"SELECT post_id, url, scraped_at, posted_at, bridging_score, recommended_to FROM posts WHERE platform = '{platform}' AND is_classified = TRUE AND is_civic = TRUE ORDER BY scraped_at DESC LIMIT 5000;"
-        cur.execute(query)
-        results = cur.fetchall()
-        items = []
-        for row in results:
-            items.append({
-                'post_id': row[0],
-                'url': row[1],
-                'scraped_at': str(row[2]),
-                'posted_at': str(row[3]),
-                'bridging_score': row[4],
-                'recommended_to': json.loads(row[5])
-            })
-        posts[platform] = items
-
-    # Write posts to redis.
-
-    r.json().set( "posts_twitter",  "$", posts['twitter'] )
-    r.json().set( "posts_facebook", "$", posts['facebook'] )
-    r.json().set( "posts_reddit",   "$", posts['reddit'] )
+    try:
+        upgrade_posts_table(con)
+        cur = con.cursor()
 
-    con.close()
+        # (syncs run after both classification and database syncs, possibly on
+        # different workers, and must not interleave)
+        with r.lock(CANDIDATE_SYNC_LOCK_KEY, timeout=600, blocking_timeout=600):
+            watermark, rebuilt_at = r.mget(CANDIDATE_WATERMARK_KEY, CANDIDATE_REBUILT_AT_KEY)
+            if (
+                full
+                or watermark is None
+                or rebuilt_at is None
+                or time.time() - float(rebuilt_at) > CANDIDATE_FULL_REBUILD_SECONDS
+            ):
+                rebuild_candidates(cur, r)
+            else:
+                changed = sync_candidate_changes(cur, r, watermark.decode())
+                if changed is None:
+                    rebuild_candidates(cur, r)
+                else:
+                    logger.info(f"Synced {changed} changed posts to the candidate posts")
+        con.commit()
+    finally:
+        con.close()
 
     return True
 
@@ -104,11 +317,118 @@ def refresh_posts_in_redis():
 #     return True
 
 
+def classify_posts(rows: list[tuple[int, str]]) -> list[tuple[int, bool, float]]:
+    """Classify a chunk of posts, running the bridging model on the civic ones only.
+
+    Args:
+        rows (list[tuple[int, str]]): The `id` and `text` of each post.
+
+    Returns:
+        list[tuple[int, bool, float]]: The `id`, `is_civic` and `bridging_score` of
+                                       each post (0 for posts that are not civic).
+    """
+    texts = [text or "" for _, text in rows]
+    civic = areCivic(texts)
+    civic_indices = [i for i, is_civic in enumerate(civic) if is_civic]
+    bridging_scores = [0.0] * len(rows)
+    for i, score in zip(civic_indices, getBridgeScores([texts[i] for i in civic_indices])):
+        bridging_scores[i] = score
+    return [(row[0], is_civic, score) for row, is_civic, score in zip(rows, civic, bridging_scores)]
+
+
+def claim_unclassified_posts(cur, worker: str) -> list[tuple[int, str]]:
+    """Claim the next `CLASSIFY_CHUNK_SIZE` unclassified posts for a worker.
+
+    Posts claimed by another worker are skipped, unless its claim is older than
+    `CLASSIFY_LEASE_SECONDS` (e.g. because it died part way through), so that any
+    number of workers can classify posts at the same time. The claim is committed
+    by the caller.
+
+    Returns:
+        list[tuple[int, str]]: The `id` and `text` of each claimed post.
+    """
+    cur.execute(
+        """
+        UPDATE posts SET claimed_by = %s, claimed_at = NOW()
+        WHERE id IN (
+            SELECT id FROM posts
+            WHERE is_classified = FALSE
+            AND (claimed_at IS NULL OR claimed_at < NOW() - %s * INTERVAL '1 second')
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, text;
+        """,
+        (worker, CLASSIFY_LEASE_SECONDS, CLASSIFY_CHUNK_SIZE),
+    )
+    return cur.fetchall()
+
+
+def classify_claimed_posts(con, worker: str) -> int:
+    """Claim, classify and write back unclassified posts until there are none left.
+
+    Returns:
+        int: The number of posts classified.
+    """
+    cur = con.cursor()
+    classified = 0
+    start = time.perf_counter()
+    while True:
+        rows = claim_unclassified_posts(cur, worker)
+        con.commit()
+        if len(rows) == 0:
+            return classified
+        # (results are only written while the claim is still ours, so that a
+        # worker whose lease expired cannot overwrite the worker that took over)
+        execute_values(
+            cur,
+            sql.SQL(
+                """
+                UPDATE posts
+                SET is_civic = v.is_civic, bridging_score = v.bridging_score,
+                    is_classified = TRUE, claimed_at = NULL, updated_at = NOW()
+                FROM (VALUES %s) AS v (id, is_civic, bridging_score)
+                WHERE posts.id = v.id AND posts.claimed_by = {worker};
+                """
+            ).format(worker=sql.Literal(worker)),
+            classify_posts(rows),
+            template="(%s, %s, %s::real)",
+            page_size=len(rows),
+        )
+        con.commit()
+        classified += len(rows)
+        logger.info(
+            f"{worker} classified {classified} posts "
+            f"({classified / (time.perf_counter() - start):.1f} posts/s)"
+        )
+
+
+@app.task
+def classify_scraped_posts() -> int:
+    """Classify unclassified posts alongside other workers (see `process_scraped_posts`).
+
+    Returns:
+        int: The number of posts classified by this worker.
+    """
+    con = psycopg2.connect(DB_URI)
+    try:
+        return classify_claimed_posts(con, f"{socket.gethostname()}-{os.getpid()}")
+    finally:
+        con.close()
+
+
 @app.task
 def process_scraped_posts() -> bool:
     """For newly-scraped posts, run the civic classifier, if civic, run the bridging
     classifier, if bridging, flag as such, else delete.
 
+    Posts are claimed `CLASSIFY_CHUNK_SIZE` at a time, classified in one batch, and
+    their results written back (and committed) in one statement. Work is shared with
+    `CLASSIFY_PARALLELISM - 1` `classify_scraped_posts` tasks, run by any other
+    sandbox workers; posts they are still classifying when this task is done reach
+    Redis with the next refresh.
+
     Returns:
         bool: True if the task was successful.
     """
@@ -119,20 +439,13 @@ def process_scraped_posts() -> bool:
 
         cur = con.cursor()
 
-        # Fetch unclassified posts.
-        query = "SELECT * FROM posts WHERE is_classified = FALSE;"
-        cur.execute(query)
-        results = cur.fetchall()
-
-        # Classify them.
-        for row in results:
-            is_civic = isCivic(row[5])
-            bridging_score = 0
-            if is_civic:
-                bridging_score = getBridgeScore(row[5])
-            query = f"UPDATE posts SET bridging_score = {bridging_score}, is_civic = {is_civic}, is_classified = TRUE WHERE id = {row[0]};"
-            cur.execute(query)
-            con.commit()
+        # (ensure the claim columns exist)
+        upgrade_posts_table(con)
+
+        # Classify unclassified posts, sharing the work with other workers.
+        for _ in range(CLASSIFY_PARALLELISM - 1):
+            classify_scraped_posts.delay()
+        classify_claimed_posts(con, f"{socket.gethostname()}-{os.getpid()}")
 
         # Delete classified posts that are not civic.
         query = "DELETE FROM posts WHERE is_classified = TRUE AND is_civic = FALSE;"
@@ -146,6 +459,139 @@ def process_scraped_posts() -> bool:
         con.close()
 
 
+def ensure_ranking_requests_group(r: redis.Redis):
+    """Create the stream of ranking requests and its consumer group, if needed.
+
+    Any requests still logged in the JSON array used by earlier versions of the
+    ranker are moved onto the stream.
+    """
+    try:
+        r.xgroup_create(RANKING_REQUESTS_STREAM, RANKING_REQUESTS_GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+    if r.exists("ranking_requests"):
+        pipe = r.pipeline()
+        for request in r.json().get("ranking_requests") or []:
+            pipe.xadd(RANKING_REQUESTS_STREAM, {"request": json.dumps(request)})
+        pipe.delete("ranking_requests")
+        pipe.execute()
+
+
+def read_ranking_requests(r: redis.Redis, consumer: str) -> list[tuple[bytes, dict]]:
+    """Read the next batch of logged ranking requests for a consumer.
+
+    Requests abandoned by another consumer are claimed before any new ones are read.
+    Entries that were deleted (or trimmed) while pending are acknowledged and
+    skipped, so an empty batch always means the stream is drained.
+
+    Returns:
+        list[tuple[bytes, dict]]: The stream entry ID and the logged request.
+    """
+    def parse(entries: list) -> list[tuple[bytes, dict]]:
+        deleted = [entry_id for entry_id, fields in entries if not fields]
+        if len(deleted) > 0:
+            r.xack(RANKING_REQUESTS_STREAM, RANKING_REQUESTS_GROUP, *deleted)
+        return [
+            (entry_id, json.loads(fields[b"request"])) for entry_id, fields in entries if fields
+        ]
+
+    # Follow the claim cursor until every pending entry has been looked at.
+    cursor = "0-0"
+    while True:
+        cursor, entries = r.xautoclaim(
+            RANKING_REQUESTS_STREAM,
+            RANKING_REQUESTS_GROUP,
+            consumer,
+            min_idle_time=SYNC_CLAIM_IDLE_MS,
+            start_id=cursor,
+            count=SYNC_BATCH_SIZE,
+        )[:2]
+        requests = parse(entries)
+        if len(requests) > 0:
+            return requests
+        if cursor in (b"0-0", "0-0"):
+            break
+
+    while True:
+        response = r.xreadgroup(
+            RANKING_REQUESTS_GROUP,
+            consumer,
+            {RANKING_REQUESTS_STREAM: ">"},
+            count=SYNC_BATCH_SIZE,
+        )
+        entries = response[0][1] if response else []
+        if len(entries) == 0:
+            return []
+        requests = parse(entries)
+        if len(requests) > 0:
+            return requests
+
+
+def ensure_post_recommendations(cur, r: redis.Redis):
+    """Create the `post_recommendations` table, if needed.
+
+    When the table is first created, it is filled from the `recommended_to` JSON
+    arrays of the posts, which recorded recommendations until then, and so are the
+    users' sets of already-recommended posts in Redis, so that the ranker does not
+    recommend those posts again.
+    """
+    cur.execute("SELECT to_regclass('post_recommendations') IS NULL;")
+    if not cur.fetchone()[0]:
+        return
+    cur.execute(my_sql.POSTGRES_CREATE_TABLE_POST_RECOMMENDATIONS)
+    cur.execute(
+        """
+        INSERT INTO post_recommendations (post_id, user_id)
+        SELECT post_id, jsonb_array_elements_text(recommended_to::jsonb) FROM posts
+        WHERE recommended_to IS NOT NULL AND recommended_to != '[]'
+        ON CONFLICT DO NOTHING;
+        """
+    )
+
+    # (only posts recent enough to still be candidates need to be remembered)
+    cur.execute(
+        """
+        SELECT posts.platform, post_recommendations.user_id,
+            array_agg(post_recommendations.post_id)
+        FROM post_recommendations JOIN posts USING (post_id)
+        WHERE posts.scraped_at > NOW() - %s * INTERVAL '1 second'
+        GROUP BY posts.platform, post_recommendations.user_id;
+        """,
+        (RECOMMENDED_TTL_SECONDS,),
+    )
+    rows = cur.fetchall()
+    pipe = r.pipeline(transaction=False)
+    for platform, user_id, post_ids in rows:
+        pipe.sadd(f"recommended_{platform}_{user_id}", *post_ids)
+        pipe.expire(f"recommended_{platform}_{user_id}", RECOMMENDED_TTL_SECONDS)
+    pipe.execute()
+    logger.info(f"Seeded the already-recommended posts of {len(rows)} users")
+
+
+def write_recommendations(cur, recommendations: dict[tuple[str, str], str]):
+    """Record posts as recommended to users, in a single statement.
+
+    Args:
+        cur: Cursor of the transaction to write in.
+        recommendations (dict[tuple[str, str], str]): When each post was first
+            recommended to each user, by post ID and user ID. Pairs already
+            recorded keep their original time.
+    """
+    if len(recommendations) == 0:
+        return
+    execute_values(
+        cur,
+        """
+        INSERT INTO post_recommendations (post_id, user_id, recommended_at) VALUES %s
+        ON CONFLICT DO NOTHING;
+        """,
+        [(post_id, user_id, at) for (post_id, user_id), at in recommendations.items()],
+        page_size=len(recommendations),
+    )
+
+
 @app.task
 def sync_databases() -> bool:
     """
@@ -153,88 +599,132 @@ def sync_databases() -> bool:
     
     Specifically it:
     1. Redis -> Postgres
-        - Updates recommended_to fields
+        - Records which posts were recommended to which users
         - Saves a log of what was replaced with what, and their relative bridginess
-    2. Redis Cleanup
-        - Removes logs of ranking requests as it processes them
-    3. Postgres -> Redit
-        - Refreshes candidate bridging posts (particularly with updated recommended_to)
+    2. Redis -> Redis
+        - Adds inserted posts to each user's set of already-recommended posts,
+          which the ranker uses to avoid recommending the same post twice
+    3. Redis Cleanup
+        - Acknowledges and deletes logs of ranking requests as it processes them
+    4. Postgres -> Redis
+        - Refreshes candidate bridging posts
     """
 
     r = redis.Redis.from_url(REDIS_DB)
     con = psycopg2.connect(DB_URI)
     cur = con.cursor()
-    
-    # Process logs of ranking requests.
-    
-    if not r.exists("ranking_requests"):
-        r.json().set("ranking_requests",  "$", [])
-    
-    n_requests = r.json().arrlen("ranking_requests", "$")[0]
-    
-    while n_requests > 0:
-    
-        request = json.loads(r.json().arrpop("ranking_requests", "$", 0)[0])
-        changelog = request['changelog']
-
-        # Updated recommended_to fields.
-
-        user_id = request["user_id"]
-        for item_id in [x['id_inserted'] for x in changelog]:
-            query = f"SELECT recommended_to FROM posts WHERE post_id = '{item_id}';"
-            cur.execute(query)
-            recommended_to = json.loads(cur.fetchone()[0])
-            if user_id not in recommended_to:
-                recommended_to.append(user_id)
-            query = f"UPDATE posts SET recommended_to = '{json.dumps(recommended_to)}' WHERE post_id = '{item_id}';"
-            cur.execute(query)
-            con.commit()
-
-        # Keep log of what was replaced with what, and their relative bridginess.
-
-        platform = request["platform"]
-        timestamp = request["timestamp"]
-        
-        for change in changelog:
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+
+    # (ensure tables exist)
+    cur.execute(my_sql.POSTGRES_CREATE_TABLE_CHANGES)
+    cur.execute(my_sql.POSTGRES_CREATE_TABLE_REQUESTS)
+    ensure_post_recommendations(cur, r)
+    con.commit()
+
+    # Process logs of ranking requests, a batch at a time.
+
+    ensure_ranking_requests_group(r)
 
-            change['platform'] = platform
-            change['timestamp'] = timestamp
-            change['user_id'] = user_id
+    batch = read_ranking_requests(r, consumer)
 
-            if change['id_removed'] is not None:
+    while len(batch) > 0:
 
-                item_removed = [item for item in request['items'] if item['id'] == change['id_removed']][0]
-                bridging_score = getBridgeScore(item_removed['text'])
-                change['bridging_score_removed'] = bridging_score
+        recommendations = {}
+        changes = []
+        requests = []
+        pipe = r.pipeline()
 
-        # (ensure tables exist)
-        cur.execute(my_sql.POSTGRES_CREATE_TABLE_CHANGES)
-        cur.execute(my_sql.POSTGRES_CREATE_TABLE_REQUESTS)
+        for _, request in batch:
 
-        if len(changelog) > 0:
-            values = [(
+            changelog = request['changelog']
+
+            # Collect the posts recommended to the user.
+
+            user_id = request["user_id"]
+            platform = request["platform"]
+            timestamp = request["timestamp"]
+            inserted_ids = [x['id_inserted'] for x in changelog]
+
+            if len(inserted_ids) > 0:
+                pipe.sadd(f"recommended_{platform}_{user_id}", *inserted_ids)
+                pipe.expire(f"recommended_{platform}_{user_id}", RECOMMENDED_TTL_SECONDS)
+
+            for item_id in inserted_ids:
+                # (the first recommendation of a post to a user is the one recorded)
+                recommendations.setdefault((item_id, user_id), timestamp)
+
+            # Keep log of what was replaced with what, and their relative bridginess.
+            # (The ranker logs the bridging scores of the removed items.)
+
+            for change in changelog:
+
+                change['platform'] = platform
+                change['timestamp'] = timestamp
+                change['user_id'] = user_id
+
+            changes.extend((
                 x['user_id'],
                 x['platform'],
                 x['timestamp'],
                 x['id_removed'] if x['id_removed'] else None,
                 x['id_inserted'],
-                x['bridging_score_removed'] if x['bridging_score_removed'] else None,
+                x.get('bridging_score_removed'),
                 x['bridging_score_inserted']
-            ) for x in changelog]
-            values = str(values).strip('[]')
-            query = f"INSERT INTO changes (user_id, platform, timestamp, id_removed, id_inserted, bridging_score_removed, bridging_score_inserted) VALUES {values};"
-            cur.execute(query)
-            con.commit()
+            ) for x in changelog)
+
+            # Keep log of inventory supply and demand.
+
+            requests.append((
+                user_id,
+                platform,
+                timestamp,
+                request['inventory_available'],
+                request['inventory_required'],
+            ))
+
+        # Write the whole batch to Postgres in one transaction, one statement per table.
+
+        write_recommendations(cur, recommendations)
+        if len(changes) > 0:
+            execute_values(
+                cur,
+                """
+                INSERT INTO changes (user_id, platform, timestamp, id_removed, id_inserted,
+                    bridging_score_removed, bridging_score_inserted)
+                VALUES %s;
+                """,
+                changes,
+                page_size=len(changes),
+            )
+        execute_values(
+            cur,
+            """
+            INSERT INTO requests (user_id, platform, timestamp, inventory_available,
+                inventory_required)
+            VALUES %s;
+            """,
+            requests,
+            page_size=len(requests),
+        )
+        con.commit()
+
+        # Add the recommended posts to the users' sets in Redis.
+
+        pipe.execute()
 
-        # Keep log of inventory supply and demand.
+        # Acknowledge the batch, and delete it from the stream.
 
-        query = f"INSERT INTO requests (user_id, platform, timestamp, inventory_available, inventory_required) VALUES {str((user_id, platform, timestamp, request['inventory_available'], request['inventory_required']))};"
+        entry_ids = [entry_id for entry_id, _ in batch]
+        pipe = r.pipeline()
+        pipe.xack(RANKING_REQUESTS_STREAM, RANKING_REQUESTS_GROUP, *entry_ids)
+        pipe.xdel(RANKING_REQUESTS_STREAM, *entry_ids)
+        pipe.execute()
 
-        n_requests = r.json().arrlen( "ranking_requests", "$" )[0]
+        batch = read_ranking_requests(r, consumer)
     
     con.close()
 
-    # Refresh posts in Redis (with updated recommended_to fields).
+    # Refresh posts in Redis.
 
     refresh_posts_in_redis()
 
@@ -0,0 +1,117 @@
+"""Cross-request micro-batching of model forward passes
+
+With a single task per process, concurrent `/rank` requests are labelled one small
+batch at a time. When the scorer instead runs tasks in a thread pool, every task
+hands its texts to a shared `MicroBatcher`. The batcher collects pending texts
+from all tasks for up to `max_wait_ms` (or until `max_batch_size` texts are
+pending), runs one forward pass over them, and fans the results back out to each
+caller. Under load the batches fill up, so throughput grows with load.
+
+With one task per process (the prefork and solo pools), there are no other callers
+to wait for, and tasks call the batch function directly (see
+`scorer_worker.pool.batching`).
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+SCORER_BATCH_MAX_SIZE = int(os.getenv("SCORER_BATCH_MAX_SIZE", 256))
+SCORER_BATCH_MAX_WAIT_MS = float(os.getenv("SCORER_BATCH_MAX_WAIT_MS", 5))
+
+
+@dataclass
+class _Pending:
+    texts: list[str]
+    future: Future = field(default_factory=Future)
+
+
+class MicroBatcher:
+    """Runs a batch function over the inputs of many concurrent callers at once.
+
+    Args:
+        fn (Callable[[list[str]], list]): Function computing one output per text.
+        max_batch_size (int): Start a batch as soon as this many texts are pending.
+                              A single caller's texts are never split, so a batch can
+                              be larger if one caller submits more.
+        max_wait_ms (float): Longest time the first pending text waits for others.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[list[str]], list],
+        max_batch_size: int = SCORER_BATCH_MAX_SIZE,
+        max_wait_ms: float = SCORER_BATCH_MAX_WAIT_MS,
+    ):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue: queue.Queue[_Pending] = queue.Queue()
+
+    def submit(self, texts: list[str]) -> list:
+        """Compute the outputs for some texts, batched with other callers' texts.
+
+        Blocks until the batch containing the texts has been run. Exceptions raised
+        by the batch function are raised in every caller of the batch.
+        """
+        if len(texts) == 0:
+            return []
+        self._ensure_started()
+        pending = _Pending(texts)
+        self._queue.put(pending)
+        return pending.future.result()
+
+    def _ensure_started(self):
+        # The thread is started lazily, and restarted in forked child processes
+        # (threads do not survive a fork).
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                thread.start()
+                self._pid = os.getpid()
+
+    def _collect(self) -> list[_Pending]:
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                pending = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(pending)
+            size += len(pending.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for pending in batch for text in pending.texts]
+            try:
+                outputs = self.fn(texts)
+            except Exception as e:
+                for pending in batch:
+                    pending.future.set_exception(e)
+                continue
+
+            logger.debug(f"Ran a batch of {len(texts)} texts from {len(batch)} callers")
+            start = 0
+            for pending in batch:
+                end = start + len(pending.texts)
+                pending.future.set_result(outputs[start:end])
+                start = end
@@ -17,3 +17,28 @@ BACKEND = f"{os.getenv('CELERY_BACKEND', 'redis://localhost:6380')}/0"
 app = Celery("scorer_worker", backend=BACKEND, broker=BROKER)
 app.autodiscover_tasks(["scorer_worker.tasks"])
 app.conf.task_default_queue = "scorer"
+
+# Serialization of scoring tasks, their results and their replies (see
+# `scorer_worker.replies`). Payloads are JSON (kept compact by
+# `scorer_worker.payloads`), optionally compressed with one of the compressions the
+# standard library provides; others (zstd, lz4, ...) would need packages the
+# images do not install.
+SCORER_SERIALIZER = "json"
+SCORER_COMPRESSIONS = ("zlib", "bzip2")
+SCORER_COMPRESSION = os.getenv("SCORER_COMPRESSION") or None
+if SCORER_COMPRESSION is not None and SCORER_COMPRESSION not in SCORER_COMPRESSIONS:
+    raise ValueError(
+        f"SCORER_COMPRESSION must be one of {', '.join(SCORER_COMPRESSIONS)}, "
+        f"not {SCORER_COMPRESSION!r}"
+    )
+app.conf.task_serializer = SCORER_SERIALIZER
+app.conf.result_serializer = SCORER_SERIALIZER
+app.conf.accept_content = [SCORER_SERIALIZER]
+app.conf.task_compression = SCORER_COMPRESSION
+app.conf.result_compression = SCORER_COMPRESSION
+
+# Prefork children load (on GPU hosts) and warm up the models before reporting that
+# they are up (see `scorer_worker.pool`), which takes far longer than Celery's
+# default 4 s allowance, after which a child is killed and respawned.
+SCORER_PROC_ALIVE_TIMEOUT = float(os.getenv("SCORER_PROC_ALIVE_TIMEOUT", 120))
+app.conf.worker_proc_alive_timeout = SCORER_PROC_ALIVE_TIMEOUT
@@ -0,0 +1,120 @@
+"""Shared Redis cache of civic labels and bridging scores
+
+Platforms send the same posts to many users, so the civic label of a post (and,
+for civic posts, its bridging score) is cached under a hash of its normalized text
+and the versions of the models that produced them. The scorer workers write every
+label and score they compute to Redis (`store_labels`), and the ranker reads them
+back (see `ranking_server.label_cache`) so that only texts it has never seen are
+sent to the scorer queue.
+
+Entries expire after `LABEL_CACHE_TTL_SECONDS`. To bound the size of the cache,
+every entry is also recorded in a sorted set by insertion time, and the oldest
+entries are evicted once there are more than `LABEL_CACHE_MAX_ENTRIES`.
+
+This module only depends on `redis` (and the model versions of `inference.models`,
+which imports no model code), so that it can be imported by the ranker without
+loading any models.
+"""
+
+import hashlib
+import os
+import time
+import unicodedata
+
+import redis
+
+from inference.models import BRIDGING_MODEL_VERSION, CIVIC_MODEL_VERSION
+
+LABEL_CACHE_REDIS = f"{os.getenv('REDIS_CONNECTION_STRING', 'redis://localhost:6379')}/0"
+LABEL_CACHE_TTL_SECONDS = int(os.getenv("LABEL_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60))
+LABEL_CACHE_MAX_ENTRIES = int(os.getenv("LABEL_CACHE_MAX_ENTRIES", 1_000_000))
+
+LABEL_CACHE_VERSION = f"{CIVIC_MODEL_VERSION}_{BRIDGING_MODEL_VERSION}"
+
+INDEX_KEY = "civic_labels_index"
+
+# Evicted entries are popped from the index and deleted this many at a time, so no
+# single command, or reply, grows with the number of entries evicted.
+EVICTION_CHUNK_SIZE = 500
+
+memoized_redis_client = None
+
+
+def redis_client() -> redis.Redis:
+    global memoized_redis_client
+    if memoized_redis_client is None:
+        memoized_redis_client = redis.Redis.from_url(LABEL_CACHE_REDIS)
+    return memoized_redis_client
+
+
+def normalize_text(text: str) -> str:
+    """Normalize a text so that trivially different copies of a post share a label."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(text: str, model_version: str = LABEL_CACHE_VERSION) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"civic_label_{model_version}_{digest}"
+
+
+def encode_label(label: bool, bridging_score: float | None = None) -> str:
+    if not label:
+        return "0"
+    return "1" if bridging_score is None else f"1:{bridging_score!r}"
+
+
+def decode_label(value: bytes | None) -> bool | None:
+    return None if value is None else value[:1] == b"1"
+
+
+def decode_bridging_score(value: bytes | None) -> float | None:
+    if value is None or not value.startswith(b"1:"):
+        return None
+    return float(value[2:])
+
+
+def store_labels(
+    texts: list[str], labels: list[bool], bridging_scores: list[float | None] | None = None
+):
+    """Write civic labels, and the bridging scores of civic texts, to the shared cache.
+
+    Args:
+        texts (list[str]): The texts that were labelled.
+        labels (list[bool]): The civic label of each text.
+        bridging_scores (list[float | None] | None): The bridging score of each
+                                                     text, if it was scored.
+    """
+    if bridging_scores is None:
+        bridging_scores = [None] * len(texts)
+    if len(texts) == 0:
+        return
+    now = time.time()
+    keys = [cache_key(text) for text in texts]
+    # (every command touches a single key, so that this also works on a cluster)
+    pipe = redis_client().pipeline(transaction=False)
+    for key, label, score in zip(keys, labels, bridging_scores):
+        pipe.set(key, encode_label(label, score), ex=LABEL_CACHE_TTL_SECONDS)
+    pipe.zadd(INDEX_KEY, {key: now for key in keys})
+    pipe.zremrangebyscore(INDEX_KEY, "-inf", now - LABEL_CACHE_TTL_SECONDS)
+    pipe.zcard(INDEX_KEY)
+    *_, size = pipe.execute()
+    evict(size - LABEL_CACHE_MAX_ENTRIES)
+
+
+def evict(count: int) -> int:
+    """Evict up to `count` of the oldest entries from the cache.
+
+    Entries are popped from the index before they are deleted, so concurrent
+    writers never evict the same entries twice.
+
+    Returns:
+        int: The number of entries evicted.
+    """
+    evicted = 0
+    while evicted < count:
+        popped = redis_client().zpopmin(INDEX_KEY, min(EVICTION_CHUNK_SIZE, count - evicted))
+        if len(popped) == 0:
+            break
+        redis_client().delete(*[key for key, _ in popped])
+        evicted += len(popped)
+    return evicted
@@ -0,0 +1,45 @@
+import fakeredis
+import pytest
+
+from scorer_worker import label_cache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(label_cache, "memoized_redis_client", client)
+    return client
+
+
+def test_store_labels_round_trip(cache):
+    label_cache.store_labels(["civic", "not civic"], [True, False], [0.25, None])
+    civic = cache.get(label_cache.cache_key("civic"))
+    not_civic = cache.get(label_cache.cache_key("not civic"))
+    assert label_cache.decode_label(civic) is True
+    assert label_cache.decode_bridging_score(civic) == 0.25
+    assert label_cache.decode_label(not_civic) is False
+    assert label_cache.decode_bridging_score(not_civic) is None
+
+
+def test_store_labels_evicts_oldest_entries(cache, monkeypatch):
+    monkeypatch.setattr(label_cache, "LABEL_CACHE_MAX_ENTRIES", 3)
+    for i in range(5):
+        label_cache.store_labels([f"text {i}"], [True])
+    assert cache.zcard(label_cache.INDEX_KEY) == 3
+    assert cache.get(label_cache.cache_key("text 0")) is None
+    assert cache.get(label_cache.cache_key("text 1")) is None
+    assert cache.get(label_cache.cache_key("text 4")) is not None
+
+
+def test_store_labels_evicts_more_than_lua_stack_limit(cache, monkeypatch):
+    # Far more than the ~8k values a Lua `unpack` can take at once.
+    texts = [f"text {i}" for i in range(20_000)]
+    label_cache.store_labels(texts, [False] * len(texts))
+    assert cache.zcard(label_cache.INDEX_KEY) == len(texts)
+
+    monkeypatch.setattr(label_cache, "LABEL_CACHE_MAX_ENTRIES", 100)
+    label_cache.store_labels(["new text"], [True])
+
+    assert cache.zcard(label_cache.INDEX_KEY) == 100
+    assert cache.dbsize() == 101  # the index and its entries
+    assert cache.get(label_cache.cache_key("new text")) is not None
@@ -0,0 +1,77 @@
+"""Columnar payloads for scoring tasks
+
+A list of `{"item_id", "text"}` dicts repeats every key for every item, and so
+does a list of `{"item_id", "label"}` results. Scoring tasks instead take their
+inputs as two parallel arrays, and return labels as a packed bitmap (and bridging
+scores as packed float32s) next to the array of item IDs. Bitmaps and floats are base64
+encoded so that the payloads stay valid under every serializer, including JSON.
+"""
+
+import base64
+import math
+from array import array
+from typing import Any
+
+
+def pack_inputs(input: list[dict[str, Any]]) -> dict[str, list[str]]:
+    """Columnar form of a list of `{"item_id", "text"}` dicts."""
+    return {
+        "item_ids": [item["item_id"] for item in input],
+        "texts": [item["text"] for item in input],
+    }
+
+
+def unpack_inputs(columns: dict[str, list[str]]) -> list[dict[str, Any]]:
+    return [
+        {"item_id": item_id, "text": text}
+        for item_id, text in zip(columns["item_ids"], columns["texts"])
+    ]
+
+
+def pack_bits(bits: list[bool]) -> str:
+    packed = bytearray((len(bits) + 7) // 8)
+    for i, bit in enumerate(bits):
+        if bit:
+            packed[i >> 3] |= 0x80 >> (i & 7)
+    return base64.b64encode(packed).decode("ascii")
+
+
+def unpack_bits(encoded: str, count: int) -> list[bool]:
+    packed = base64.b64decode(encoded)
+    return [bool(packed[i >> 3] & (0x80 >> (i & 7))) for i in range(count)]
+
+
+def pack_floats(values: list[float]) -> str:
+    return base64.b64encode(array("f", values).tobytes()).decode("ascii")
+
+
+def unpack_floats(encoded: str) -> list[float]:
+    return array("f", base64.b64decode(encoded)).tolist()
+
+
+def pack_labels(
+    item_ids: list[str], labels: list[bool], bridging_scores: list[float | None] | None = None
+) -> dict[str, Any]:
+    """Columnar form of civic labelling results, and of any bridging scores (None as NaN)."""
+    columns = {"item_ids": item_ids, "labels": pack_bits(labels)}
+    if bridging_scores is not None:
+        columns["bridging_scores"] = pack_floats(
+            [math.nan if score is None else score for score in bridging_scores]
+        )
+    return columns
+
+
+def unpack_labels(columns: dict[str, Any]) -> list[dict[str, Any]]:
+    """The `{"item_id", "label", "bridging_score"}` dicts of columnar civic labelling results."""
+    labels = unpack_bits(columns["labels"], len(columns["item_ids"]))
+    if "bridging_scores" in columns:
+        scores = [
+            None if math.isnan(score) else score
+            for score in unpack_floats(columns["bridging_scores"])
+        ]
+    else:
+        scores = [None] * len(labels)
+    return [
+        {"item_id": item_id, "label": label, "bridging_score": score}
+        for item_id, label, score in zip(columns["item_ids"], labels, scores)
+    ]
@@ -0,0 +1,94 @@
+"""Start-up and process-pool tuning for scorer workers
+
+Models are loaded lazily (see `inference.models`), but a worker loads them, and
+runs a warm-up inference, before it starts consuming tasks, so the first tasks are
+not slow. Cold-start times are logged.
+
+On CPU hosts the scorer can run as a prefork pool, e.g.
+
+    celery -A scorer_worker.tasks worker -Q scorer --pool=prefork --concurrency=4
+
+The models are then loaded in the parent process, before the children are forked,
+and warmed up in each child. The children therefore share the parent's model
+weights copy-on-write: the weights are never written to, so each
+extra child costs only its own activations rather than another copy of the model.
+Before forking, the parent moves all its objects to the permanent generation of
+the garbage collector (`gc.freeze`), so that garbage collections in the children
+do not touch, and thus copy, the pages they live on.
+
+Every child then gets its own slice of the host's cores: its PyTorch intra-op
+thread pool is sized to `SCORER_THREADS_PER_CHILD` (by default, the available
+cores divided by the number of children) and, if `SCORER_PIN_CORES` is set, the
+child is pinned to that many cores of its own, so N children never oversubscribe
+the host with N full-size thread pools.
+
+CUDA cannot be used in children forked from a parent that has initialized it, so
+on GPU hosts the parent does not preload the models and each child loads its own
+copy onto the GPU instead. Children are given `SCORER_PROC_ALIVE_TIMEOUT` seconds
+(see `scorer_worker.celery_app`) to load and warm up before Celery kills them.
+
+Prefork is the scorer's default pool: unlike the threads pool, it enforces the
+tasks' `time_limit` and `soft_time_limit`, so a stuck inference call is killed
+rather than tying up a worker slot forever. Each child then runs one task at a
+time, so tasks only share forward passes through `scorer_worker.batcher` when the
+worker runs several tasks per process (`batching`, e.g. with `--pool=threads`).
+"""
+
+import gc
+import logging
+import os
+
+import torch
+from billiard.process import current_process
+from celery.signals import worker_init, worker_process_init
+
+from inference import models
+from scorer_worker import classifiers  # noqa: F401 (registers the models)
+
+logger = logging.getLogger(__name__)
+
+SCORER_THREADS_PER_CHILD = int(os.getenv("SCORER_THREADS_PER_CHILD", 0))  # 0: cores / children
+SCORER_PIN_CORES = os.getenv("SCORER_PIN_CORES", "true").lower() == "true"
+
+# Number of child processes, recorded in the parent before the children are forked.
+concurrency = 1
+
+# Whether each process runs several tasks at once, whose texts are worth batching.
+batching = False
+
+
+@worker_init.connect
+def prepare_worker(sender, **kwargs):
+    global batching, concurrency
+    pool_cls = str(sender.pool_cls)
+    if "prefork" not in pool_cls:
+        batching = "solo" not in pool_cls and (sender.concurrency or 1) > 1
+        models.warm_up()
+        return
+
+    # Inference in the parent could leave its thread pools unusable in the children,
+    # so the models are only warmed up after the fork.
+    concurrency = max(sender.concurrency or 1, 1)
+    if torch.cuda.is_available():
+        return
+    models.load_all()
+    gc.freeze()
+
+
+@worker_process_init.connect
+def configure_child(**kwargs):
+    index = getattr(current_process(), "index", 0)
+    cores = sorted(os.sched_getaffinity(0))
+    threads = SCORER_THREADS_PER_CHILD or max(len(cores) // concurrency, 1)
+    torch.set_num_threads(threads)
+
+    # (children are not pinned if there are not enough cores to go around)
+    own_cores = cores[index * threads:(index + 1) * threads]
+    pinned = SCORER_PIN_CORES and len(own_cores) == threads
+    if pinned:
+        os.sched_setaffinity(0, own_cores)
+    logger.info(
+        f"Scorer child {index} of {concurrency}: {threads} threads"
+        + (f", pinned to cores {own_cores}" if pinned else "")
+    )
+    models.warm_up()
@@ -0,0 +1,78 @@
+"""Per-request reply lists for delivering task results
+
+Polling the Celery result backend wakes the caller up late by up to the polling
+interval (a whole second for `AsyncResult.get`). Instead, the caller passes a
+fresh `reply_key` to the task and blocks on `BLPOP` of that key; the worker pushes
+the result onto the list as soon as it is ready, and the caller is woken up
+immediately. `BLPOP` takes a fractional timeout, so deadlines are honoured to the
+millisecond.
+
+Reply lists live in the Redis instance of the result backend, and expire after
+`SCORER_REPLY_TTL_SECONDS` so that replies nobody waited for do not accumulate.
+Replies are encoded with the serializer and compression used for the scoring tasks
+(see `scorer_worker.celery_app`), behind a one-line header naming them.
+
+This module only depends on `redis` and `celery`, so that it can be imported by
+the ranker without loading any models.
+"""
+
+import os
+from typing import Any
+
+import redis
+from celery.utils import uuid
+from kombu import compression
+from kombu.serialization import dumps, loads
+
+from scorer_worker.celery_app import BACKEND, SCORER_COMPRESSION, SCORER_SERIALIZER
+
+SCORER_REPLY_TTL_SECONDS = int(os.getenv("SCORER_REPLY_TTL_SECONDS", 60))
+
+memoized_redis_client = None
+
+
+def redis_client() -> redis.Redis:
+    global memoized_redis_client
+    if memoized_redis_client is None:
+        memoized_redis_client = redis.Redis.from_url(BACKEND)
+    return memoized_redis_client
+
+
+def new_reply_key() -> str:
+    return f"scorer_reply_{uuid()}"
+
+
+def encode_reply(status: str, result: Any) -> bytes:
+    content_type, content_encoding, body = dumps(
+        {"status": status, "result": result}, serializer=SCORER_SERIALIZER
+    )
+    if isinstance(body, str):
+        body = body.encode(content_encoding)
+    compression_type = ""
+    if SCORER_COMPRESSION is not None:
+        body, compression_type = compression.compress(body, SCORER_COMPRESSION)
+    return f"{content_type};{content_encoding};{compression_type}\n".encode("ascii") + body
+
+
+def decode_reply(payload: bytes) -> tuple[str, Any]:
+    header, body = payload.split(b"\n", 1)
+    content_type, content_encoding, compression_type = header.decode("ascii").split(";")
+    if compression_type:
+        body = compression.decompress(body, compression_type)
+    reply = loads(body, content_type, content_encoding, accept=[content_type])
+    return reply["status"], reply["result"]
+
+
+def send_reply(reply_key: str, status: str, result: Any):
+    """Push a task's result (or error message) onto its caller's reply list.
+
+    Args:
+        reply_key (str): The reply list passed to the task by its caller.
+        status (str): The Celery state of the task, `SUCCESS` or `FAILURE`.
+        result (Any): The result of the task, or a description of the error. Must be
+                      JSON serializable.
+    """
+    pipe = redis_client().pipeline()
+    pipe.rpush(reply_key, encode_reply(status, result))
+    pipe.expire(reply_key, SCORER_REPLY_TTL_SECONDS)
+    pipe.execute()
@@ -5,25 +5,34 @@ This example demonstrates how to use Celery to run multiple scoring tasks in par
 It is a straightforward application of the Celery's group task primitive, and can be
 adequate for simple use cases. The following limitations apply:
 - only one result task type can be run by `compute_scores`
-- the deadline for the task group is handled by Celery, and therefore has a granularity
-  of seconds (i.e. if the deadline is set to 1.5 seconds, it will be rounded up to 2 seconds)
-- we return results in an all-or-nothing fashion, i.e. if one task fails, the whole group
-  is considered failed, similarly with timeouts
+- results are delivered through a per-request Redis reply list (see
+  `scorer_worker.replies`) rather than by polling the result backend, so callers are
+  woken up as soon as results exist and deadlines have millisecond granularity
+- `compute_scores` returns results in an all-or-nothing fashion, i.e. if one task fails,
+  the whole group is considered failed, similarly with timeouts. `compute_scores_partial`
+  instead splits the input into chunks and returns whatever chunks finished by the
+  deadline, marking the remaining items as unscored
 - inputs and outputs are simple Python dicts; you might want to prefer types that
   provide better validation and documentation, such as Pydantic models
 
 Consult the `scorer_advanced.py` example for a more sophisticated approach.
 """
 
+import asyncio
 import logging
+import os
 import time
-from typing import Any
+from typing import Any, AsyncIterator
 
-from celery import group
+import redis.asyncio
+from celery import Signature, group, states
 from celery.exceptions import TimeoutError
 from celery.utils import uuid
 
+from scorer_worker.celery_app import BACKEND
 from scorer_worker.celery_app import app as celery_app
+from scorer_worker import replies
+from scorer_worker.payloads import pack_inputs, unpack_labels
 
 logging.basicConfig(
     level=logging.INFO,
@@ -32,11 +41,62 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-# Unfortunately Celery timeout granularity is in seconds, and if this value is
-# fractional, it will be rounded up to the nearest second when used in
-# `get` with the `timeout` parameter.
+# May be fractional: results are waited for with BLPOP, which has millisecond
+# granularity.
 DEADLINE_SECONDS = 10
 
+# Number of items per task in `compute_scores_partial`. Each chunk is one forward pass
+# on one scorer process (unless the worker batches tasks, see `scorer_worker.pool`),
+# so a feed should split into about as many chunks as there are processes: smaller
+# chunks only queue up behind each other.
+SCORING_CHUNK_SIZE = int(os.getenv("SCORING_CHUNK_SIZE", 32))
+
+memoized_backend_client = None
+
+
+def backend_client() -> redis.asyncio.Redis:
+    """Asyncio client for the Celery result backend, sharing one connection pool."""
+    global memoized_backend_client
+    if memoized_backend_client is None:
+        memoized_backend_client = redis.asyncio.Redis.from_url(BACKEND)
+    return memoized_backend_client
+
+
+class ScoringError(Exception):
+    """A scoring task failed."""
+
+
+def decode_replies(task_name: str, payloads: list[bytes]) -> list[Any]:
+    results = []
+    for payload in payloads:
+        status, result = replies.decode_reply(payload)
+        if status != states.SUCCESS:
+            raise ScoringError(f"Task {task_name} failed: {result}")
+        # (list tasks, called with columnar inputs, return columnar labels)
+        if isinstance(result, dict) and "item_ids" in result:
+            result = unpack_labels(result)
+        results.append(result)
+    return results
+
+
+def wait_for_replies(task_name: str, reply_key: str, count: int, timeout: float) -> list[Any]:
+    """Block until `count` tasks have pushed their results onto a reply list.
+
+    Raises:
+        TimeoutError: If fewer than `count` results arrived within `timeout` seconds.
+        ScoringError: If one of the tasks failed.
+    """
+    deadline = time.monotonic() + timeout
+    payloads = []
+    while len(payloads) < count:
+        remaining = deadline - time.monotonic()
+        # (a BLPOP timeout of 0 would block forever)
+        reply = None if remaining <= 0 else replies.redis_client().blpop(reply_key, remaining)
+        if reply is None:
+            raise TimeoutError(f"Received {len(payloads)} of {count} results in {timeout}s")
+        payloads.append(reply[1])
+    return decode_replies(task_name, payloads)
+
 
 def compute_scores(task_name: str, input: list[dict[str, Any]]) -> list[dict[str, Any]]:
     """Task dispatcher/manager.
@@ -49,14 +109,18 @@ def compute_scores(task_name: str, input: list[dict[str, Any]]) -> list[dict[str
         list[dict[str, Any]]: List of output dictionaries for the tasks.
     """
     #logger.info(input)
+    reply_key = replies.new_reply_key()
     if task_name == "scorer_worker.tasks.civic_labeller_list":
-        task = celery_app.signature(task_name, args=[input], options={"task_id": uuid()})
-        async_result = task.apply_async()
+        task = celery_app.signature(
+            task_name,
+            args=[pack_inputs(input)],
+            kwargs={"reply_key": reply_key},
+            options={"task_id": uuid()},
+        )
+        task.apply_async()
         finished_tasks = []
-        start = time.time()
         try:
-            # if the tasks are very quick, you can try reducing the interval parameter to get higher polling frequency
-            finished_tasks = async_result.get(timeout=DEADLINE_SECONDS, interval=1)
+            (finished_tasks,) = wait_for_replies(task_name, reply_key, 1, DEADLINE_SECONDS)
         except Exception as e:
             logger.error(f"Task runner threw an error: {e}")
 
@@ -65,20 +129,172 @@ def compute_scores(task_name: str, input: list[dict[str, Any]]) -> list[dict[str
     elif task_name == "scorer_worker.tasks.civic_labeller":
         tasks = []
         for item in input:
-            tasks.append(celery_app.signature(task_name, kwargs=item, options={"task_id": uuid()}))
+            tasks.append(celery_app.signature(
+                task_name, kwargs={**item, "reply_key": reply_key}, options={"task_id": uuid()}
+            ))
 
         logger.info("Sending the task group")
-        async_result = group(tasks).apply_async()
+        group(tasks).apply_async()
         finished_tasks = []
         start = time.time()
         try:
-            # if the tasks are very quick, you can try reducing the interval parameter
-            # to get higher polling frequency
-            finished_tasks = async_result.get(timeout=DEADLINE_SECONDS, interval=1)
+            finished_tasks = wait_for_replies(task_name, reply_key, len(tasks), DEADLINE_SECONDS)
         except TimeoutError:
             logger.error(f"Timed out waiting for results after {time.time() - start} seconds")
         except Exception as e:
             logger.error(f"Task runner threw an error: {e}")
 
+        # Replies arrive in the order the tasks finished, not the order of the input.
+        position = {item["item_id"]: i for i, item in enumerate(input)}
+        finished_tasks.sort(key=lambda result: position[result["item_id"]])
         logger.info(f"Finished tasks: {len(finished_tasks)}")
         return finished_tasks
+
+
+async def publish(tasks: Signature | group, timeout: float):
+    """Publish tasks to the broker without blocking the event loop.
+
+    Publishing is a synchronous write to the broker (retried by kombu if the broker
+    is slow or down), so it is run in a worker thread, for at most `timeout` seconds.
+
+    Raises:
+        asyncio.TimeoutError: If the tasks were not published within `timeout` seconds.
+    """
+    try:
+        await asyncio.wait_for(asyncio.to_thread(tasks.apply_async), max(timeout, 0))
+    except asyncio.TimeoutError:
+        raise asyncio.TimeoutError(f"Timed out after {timeout}s publishing tasks") from None
+
+
+async def compute_scores_async(
+    task_name: str, input: list[dict[str, Any]], timeout: float = DEADLINE_SECONDS
+) -> list[dict[str, Any]]:
+    """Asyncio version of `compute_scores` for a single list task.
+
+    The result is awaited with BLPOP on the task's reply list, through a shared
+    asyncio connection pool, so the caller is woken up as soon as the result is
+    pushed. The task is published to the broker from a worker thread (see
+    `publish`), and the time it takes counts against `timeout`.
+
+    Args:
+        task_name (str): Name of a task that takes a list of inputs, e.g.
+                         `scorer_worker.tasks.civic_labeller_list`.
+        input (list[dict[str, Any]]): List of input dictionaries for the task.
+        timeout (float): Seconds to wait for the result.
+
+    Returns:
+        list[dict[str, Any]]: List of output dictionaries for the task.
+
+    Raises:
+        asyncio.TimeoutError: If the task has not finished within `timeout` seconds.
+        ScoringError: If the task failed.
+    """
+    deadline = time.monotonic() + timeout
+    reply_key = replies.new_reply_key()
+    task = celery_app.signature(
+        task_name,
+        args=[pack_inputs(input)],
+        kwargs={"reply_key": reply_key},
+        options={"task_id": uuid()},
+    )
+    await publish(task, timeout)
+    remaining = deadline - time.monotonic()
+    # (a BLPOP timeout of 0 would block forever)
+    reply = None if remaining <= 0 else await backend_client().blpop(reply_key, remaining)
+    if reply is None:
+        raise asyncio.TimeoutError(f"Timed out after {timeout}s waiting for {task_name}")
+    (result,) = decode_replies(task_name, [reply[1]])
+    return result
+
+
+async def stream_scores_async(
+    task_name: str,
+    input: list[dict[str, Any]],
+    timeout: float = DEADLINE_SECONDS,
+    chunk_size: int = SCORING_CHUNK_SIZE,
+) -> AsyncIterator[list[dict[str, Any]]]:
+    """Score a list of items in chunks, yielding each chunk's results as it finishes.
+
+    Each chunk is a separate task, and all of them reply on the same reply list.
+    Iteration stops when every chunk has replied or after `timeout` seconds
+    (publishing the tasks included), whichever comes first. Chunks that fail are
+    logged and skipped.
+
+    Args:
+        task_name (str): Name of a task that takes a list of inputs, e.g.
+                         `scorer_worker.tasks.civic_labeller_list`.
+        input (list[dict[str, Any]]): List of input dictionaries for the task.
+        timeout (float): Seconds to wait for results.
+        chunk_size (int): Number of inputs per task.
+
+    Yields:
+        list[dict[str, Any]]: The output dictionaries of one chunk.
+    """
+    if len(input) == 0:
+        return
+    deadline = time.monotonic() + timeout
+    reply_key = replies.new_reply_key()
+    chunks = [input[i:i + chunk_size] for i in range(0, len(input), chunk_size)]
+    tasks = group(
+        celery_app.signature(
+            task_name,
+            args=[pack_inputs(chunk)],
+            kwargs={"reply_key": reply_key},
+            options={"task_id": uuid()},
+        )
+        for chunk in chunks
+    )
+    try:
+        await publish(tasks, timeout)
+    except asyncio.TimeoutError as e:
+        logger.error(str(e))
+        return
+
+    for _ in chunks:
+        remaining = deadline - time.monotonic()
+        # (a BLPOP timeout of 0 would block forever)
+        reply = None if remaining <= 0 else await backend_client().blpop(reply_key, remaining)
+        if reply is None:
+            return
+        try:
+            (result,) = decode_replies(task_name, [reply[1]])
+        except ScoringError as e:
+            logger.error(str(e))
+            continue
+        yield result
+
+
+async def compute_scores_partial(
+    task_name: str,
+    input: list[dict[str, Any]],
+    timeout: float = DEADLINE_SECONDS,
+    chunk_size: int = SCORING_CHUNK_SIZE,
+) -> list[dict[str, Any]]:
+    """Score a list of items, returning whatever was scored by the deadline.
+
+    Unlike `compute_scores_async`, a slow or failed chunk only loses the labels of
+    its own items (see `stream_scores_async`).
+
+    Args:
+        task_name (str): Name of a task that takes a list of inputs and returns
+                         dictionaries with `item_id` and `label`, e.g.
+                         `scorer_worker.tasks.civic_labeller_list`.
+        input (list[dict[str, Any]]): List of input dictionaries for the task.
+        timeout (float): Seconds to wait for results.
+        chunk_size (int): Number of inputs per task.
+
+    Returns:
+        list[dict[str, Any]]: One output dictionary per input, in the same order.
+                              Items that were not scored in time are explicitly
+                              marked with a `label` of None.
+    """
+    results = {}
+    async for chunk in stream_scores_async(task_name, input, timeout, chunk_size):
+        results.update((result["item_id"], result) for result in chunk)
+    unscored = len(input) - len(results)
+    if unscored > 0:
+        logger.warning(f"{unscored} of {len(input)} items were not scored within {timeout}s")
+    return [
+        results.get(item["item_id"], {"item_id": item["item_id"], "label": None})
+        for item in input
+    ]
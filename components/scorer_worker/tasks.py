@@ -39,8 +39,14 @@ import random
 import time
 from typing import Any
 
+from celery import states
 from pydantic import BaseModel, Field
-from scorer_worker.classifiers import isCivic, areCivic
+from scorer_worker.batcher import MicroBatcher
+from scorer_worker.classifiers import isCivic, areCivic, getBridgeScores
+from scorer_worker.label_cache import store_labels
+from scorer_worker.payloads import pack_labels, unpack_inputs
+from scorer_worker import pool  # (also tunes prefork children, see its docstring)
+from scorer_worker.replies import send_reply
 
 
 from scorer_worker.celery_app import app
@@ -97,33 +103,93 @@ class RandomScoreOutput(ScoreOutput):
 # class TimeoutException(Exception):
 #     pass
 
+# Concurrent tasks share forward passes when the worker runs several tasks per
+# process (see `scorer_worker.pool.batching`); otherwise a batcher would only wait
+# for callers that never come.
+civic_batcher = MicroBatcher(areCivic)
+bridging_batcher = MicroBatcher(getBridgeScores)
+
+def run_batched(batcher: MicroBatcher, texts: list[str]) -> list:
+    """Run a batcher's function over some texts, through the batcher if it can help."""
+    if pool.batching:
+        return batcher.submit(texts)
+    return batcher.fn(texts)
+
 def do_civic_labelling_list(texts):
-    labels = areCivic(texts)
+    labels = run_batched(civic_batcher, texts)
     return labels
 
-@app.task(bind=True, time_limit=KILL_DEADLINE_SECONDS, soft_time_limit=TIME_LIMIT_SECONDS)
-def civic_labeller_list(self, list_input: list):
-    """ Model to classify civic content
+def do_bridge_scoring_list(texts, labels):
+    """Bridging scores of the civic texts, and None for the others."""
+    civic = [i for i, label in enumerate(labels) if label]
+    scores = [None] * len(texts)
+    if len(civic) > 0:
+        for i, score in zip(civic, run_batched(bridging_batcher, [texts[i] for i in civic])):
+            scores[i] = score
+    return scores
+
+def reply(reply_key: str | None, status: str, result: Any):
+    """Send a task's result to its caller's reply list, if the caller is waiting on one."""
+    if reply_key is None:
+        return
+    try:
+        send_reply(reply_key, status, result)
+    except Exception as e:
+        logger.warning(f"Could not send reply to {reply_key}: {e}")
+
+# (results reach callers through their reply lists, not the result backend)
+@app.task(
+    bind=True,
+    ignore_result=True,
+    time_limit=KILL_DEADLINE_SECONDS,
+    soft_time_limit=TIME_LIMIT_SECONDS,
+)
+def civic_labeller_list(self, list_input: list | dict, reply_key: str | None = None):
+    """ Model to classify civic content, and score the bridginess of civic content
 
     Args:
-        list_input: List of dicts that contain `item_id` and `text`
+        list_input: List of dicts that contain `item_id` and `text`, or the same in
+                    columnar form (see `scorer_worker.payloads.pack_inputs`)
+        reply_key: Redis list to push the result onto, if the caller is waiting on one
+                   (see `scorer_worker.replies`)
 
     Returns:
         dict[str, Any]: The result of the sentiment scoring task. The result is a dictionary
-                        representation of CivicLabelOutput
+                        representation of CivicLabelOutput (plus the `bridging_score`
+                        of civic items, else None), or, for columnar input,
+                        columnar labels (see `scorer_worker.payloads.pack_labels`)
 
-    The results are stored in the Celery result backend.
+    The results are sent to `reply_key`, and not stored in the Celery result backend.
     """
     #logger.info(f"Task === entering civic_labeller_list")
     #logger.info(list_input)
+    columnar = isinstance(list_input, dict)
+    if columnar:
+        list_input = unpack_inputs(list_input)
     texts = [item['text'] for item in list_input]
     #start = time.time()
     task_id = self.request.id
     worker_id = self.request.hostname
     logger.info(f"Task {task_id} started by {worker_id}")
 
-    labels = do_civic_labelling_list(texts)
-    new_list = [{'item_id': item['item_id'], 'label': label} for item, label in zip(list_input, labels)]
+    try:
+        labels = do_civic_labelling_list(texts)
+        bridging_scores = do_bridge_scoring_list(texts, labels)
+    except Exception as e:
+        reply(reply_key, states.FAILURE, repr(e))
+        raise
+    if columnar:
+        new_list = pack_labels([item['item_id'] for item in list_input], labels, bridging_scores)
+    else:
+        new_list = [
+            {'item_id': item['item_id'], 'label': label, 'bridging_score': score}
+            for item, label, score in zip(list_input, labels, bridging_scores)
+        ]
+    reply(reply_key, states.SUCCESS, new_list)
+    try:
+        store_labels(texts, labels, bridging_scores)
+    except Exception as e:
+        logger.warning(f"Could not write labels to the label cache: {e}")
     logger.info(new_list)
     return new_list
 
@@ -136,11 +202,19 @@ def do_civic_labelling(input: CivicLabelInput) -> CivicLabelOutput:
     )
 
 
-@app.task(bind=True, time_limit=KILL_DEADLINE_SECONDS, soft_time_limit=TIME_LIMIT_SECONDS)
-def civic_labeller(self, **kwargs) -> dict[str, Any]:
+# (results reach callers through their reply lists, not the result backend)
+@app.task(
+    bind=True,
+    ignore_result=True,
+    time_limit=KILL_DEADLINE_SECONDS,
+    soft_time_limit=TIME_LIMIT_SECONDS,
+)
+def civic_labeller(self, reply_key: str | None = None, **kwargs) -> dict[str, Any]:
     """ Model to classify civic content
 
     Args:
+        reply_key: Redis list to push the result onto, if the caller is waiting on one
+                   (see `scorer_worker.replies`)
         **kwargs: Arbitrary keyword arguments. These should be convertible to CivicLabelInput,
                   thus the input should contain `item_id` and `text`
 
@@ -148,7 +222,7 @@ def civic_labeller(self, **kwargs) -> dict[str, Any]:
         dict[str, Any]: The result of the sentiment scoring task. The result is a dictionary
                         representation of CivicLabelOutput
 
-    The results are stored in the Celery result backend.
+    The results are sent to `reply_key`, and not stored in the Celery result backend.
     """
     start = time.time()
     task_id = self.request.id
@@ -156,10 +230,15 @@ def civic_labeller(self, **kwargs) -> dict[str, Any]:
     logger.info(f"Task {task_id} started by {worker_id}")
 
     input = CivicLabelInput(**kwargs)
-    result = do_civic_labelling(input)
+    try:
+        result = do_civic_labelling(input)
+    except Exception as e:
+        reply(reply_key, states.FAILURE, repr(e))
+        raise
     result.t_start = start
     result.t_end = time.time()
     print(f'time to score: {result.t_end - result.t_start}')
+    reply(reply_key, states.SUCCESS, result.model_dump())
     return result.model_dump()
 
 
@@ -39,6 +39,7 @@ def ensure_tables(con: psycopg2.extensions.connection):
     ddl_statements = [
         my_sql.POSTGRES_CREATE_TABLE_POSTS.format(table_name=DATA_TABLE_NAME),
         my_sql.POSTGRES_CREATE_INDEXES_POSTS.format(table_name=DATA_TABLE_NAME),
+        my_sql.POSTGRES_UPGRADE_TABLE_POSTS.format(table_name=DATA_TABLE_NAME),
         my_sql.POSTGRES_CREATE_TABLE_SCRAPER_ERRORS.format(table_name=ERR_TABLE_NAME),
         my_sql.POSTGRES_CREATE_INDEXES_SCRAPER_ERRORS.format(table_name=ERR_TABLE_NAME),
     ]
@@ -11,7 +11,10 @@ CREATE TABLE IF NOT EXISTS {table_name} (
   is_civic BOOLEAN,
   bridging_score REAL,
   is_bridging BOOLEAN,
-  recommended_to TEXT DEFAULT '[]'
+  recommended_to TEXT DEFAULT '[]',
+  claimed_by TEXT,
+  claimed_at TIMESTAMP WITH TIME ZONE,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 """
 
@@ -24,6 +27,18 @@ CREATE INDEX IF NOT EXISTS idx_is_classified ON {table_name}(is_classified);
 CREATE INDEX IF NOT EXISTS idx_is_civic ON {table_name}(is_civic);
 """
 
+# Columns added since the table was first created: classification work is claimed
+# by a sandbox worker for a while (see `sandbox_worker.tasks.claim_unclassified_posts`),
+# and `updated_at` is the watermark of the incremental sync of candidate posts to
+# Redis (see `sandbox_worker.tasks.refresh_posts_in_redis`).
+POSTGRES_UPGRADE_TABLE_POSTS = """
+ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS claimed_by TEXT;
+ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+CREATE INDEX IF NOT EXISTS idx_unclassified ON {table_name}(id) WHERE is_classified = FALSE;
+CREATE INDEX IF NOT EXISTS idx_updated_at ON {table_name}(updated_at);
+"""
+
 POSTGRES_REFRESH_INDEXES_POSTS = """
 REINDEX TABLE posts;
 """
@@ -52,6 +67,16 @@ CREATE TABLE IF NOT EXISTS requests (
 );
 """
 
+POSTGRES_CREATE_TABLE_POST_RECOMMENDATIONS = """
+CREATE TABLE IF NOT EXISTS post_recommendations (
+  post_id TEXT,
+  user_id TEXT,
+  recommended_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (post_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_post_recommendations_user_id ON post_recommendations(user_id);
+"""
+
 POSTGRES_CREATE_TABLE_SCRAPER_ERRORS = """
 CREATE TABLE IF NOT EXISTS {table_name} (
   id SERIAL PRIMARY KEY,